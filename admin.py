@@ -0,0 +1,36 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import functools
+import hmac
+
+from flask import abort, current_app, request
+
+
+# ----------------------------------------------------------------------------#
+# Access.
+# ----------------------------------------------------------------------------#
+
+def authorized():
+    """Whether the request carries ADMIN_TOKEN in the X-Admin-Token header.
+
+    Never taken from the query string, where it would end up in access logs,
+    browser history and Referer headers. Without a token only the debug
+    server is open.
+    """
+    token = current_app.config.get('ADMIN_TOKEN')
+    if not token:
+        return current_app.debug
+    given = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(given.encode('utf-8'), token.encode('utf-8'))
+
+
+def admin_required(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # 404 rather than 403, so the admin pages do not advertise themselves
+        if not authorized():
+            abort(404)
+        return view(*args, **kwargs)
+    return wrapper
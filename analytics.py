@@ -0,0 +1,454 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import contextlib
+import csv
+import fcntl
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import click
+from flask import Response, abort, current_app, render_template, request, stream_with_context, url_for
+from flask.cli import AppGroup
+from prometheus_client import Histogram
+from sqlalchemy import BigInteger, cast, func, select
+
+import changes
+from models import db, Venue, Artist, Show
+from utils import LazyModule, write_atomic
+
+np = LazyModule('numpy')
+
+REPORT_SECONDS = Histogram('fyyur_report_seconds', 'Time spent computing reports', ['report'])
+
+# month and year numbers (since 1970) are packed into int64 keys next to
+# entity positions, shifted so shows before 1970 stay positive
+MONTH_SPAN, MONTH_OFFSET = 1 << 21, 1 << 20
+YEAR_SPAN, YEAR_OFFSET = 1 << 12, 1 << 11
+
+
+# ----------------------------------------------------------------------------#
+# Columnar loading.
+# ----------------------------------------------------------------------------#
+
+def show_batches(connection, since=None, until=None, batch_size=100000):
+    """Yield (venue ids, artist ids, start times in epoch seconds) as arrays,
+    a batch of shows at a time.
+
+    Rows come through a server-side cursor, so no more than one batch is
+    held in memory however many shows there are.
+    """
+    query = (select(Show.venue_id, Show.artist_id,
+                    cast(func.extract('epoch', Show.start_time), BigInteger))
+             .where(Show.venue_id.isnot(None), Show.artist_id.isnot(None)))
+    if since is not None:
+        query = query.where(Show.start_time >= since)
+    if until is not None:
+        query = query.where(Show.start_time < until)
+    result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(query)
+    for rows in result.partitions(batch_size):
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 3)
+        yield columns[:, 0], columns[:, 1], columns[:, 2]
+
+
+class Table(object):
+    """An entity table as arrays in id order, for looking up shows' ids."""
+
+    def __init__(self, ids, **columns):
+        self.ids = ids
+        self.__dict__.update(columns)
+
+    def positions(self, ids):
+        # every id is known: shows reference their venue and artist by foreign key
+        return np.searchsorted(self.ids, ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def _codes(values):
+    """Labels and the index of each value's label."""
+    labels, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return labels, codes.astype(np.int64)
+
+
+def load_venues(connection):
+    rows = connection.execute(
+        select(Venue.id, Venue.name, Venue.city, Venue.state).order_by(Venue.id)).all()
+    states, state_codes = _codes([state or '' for _, _, _, state in rows])
+    cities, city_codes = _codes([f'{(city or "").strip().lower()}|{state or ""}' for _, _, city, state in rows])
+    return Table(np.array([row[0] for row in rows], dtype=np.int64),
+                 names=[row[1] for row in rows], city_names=[row[2] for row in rows],
+                 states=states, state=state_codes, cities=cities, city=city_codes)
+
+
+def load_artists(connection):
+    """Artists with their genres as a CSR structure: the genres of the
+    artist at position i are ``genre[indptr[i]:indptr[i + 1]]``."""
+    rows = connection.execute(select(Artist.id, Artist.name, Artist.genres).order_by(Artist.id)).all()
+    vocabulary, labels, indptr, genre = {}, [], [0], []
+    for _, _, genres in rows:
+        seen = set()
+        for name in genres or []:
+            key = (name or '').strip().lower()
+            if key and key not in seen:
+                seen.add(key)
+                if key not in vocabulary:
+                    vocabulary[key] = len(labels)
+                    labels.append(name.strip())
+                genre.append(vocabulary[key])
+        indptr.append(len(genre))
+    return Table(np.array([row[0] for row in rows], dtype=np.int64),
+                 names=[row[1] for row in rows], genres=labels,
+                 indptr=np.array(indptr, dtype=np.int64), genre=np.array(genre, dtype=np.int64))
+
+
+def _genres_of(artists, positions):
+    """For artists at ``positions``: the index into ``positions`` and the
+    genre of every (artist, genre) pair, without a Python loop."""
+    starts = artists.indptr[positions]
+    lengths = artists.indptr[positions + 1] - starts
+    total = int(lengths.sum())
+    rows = np.repeat(np.arange(len(positions)), lengths)
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return rows, artists.genre[np.repeat(starts, lengths) + offsets]
+
+
+def _months(epochs):
+    return epochs.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+
+def _years(epochs):
+    return epochs.astype('datetime64[s]').astype('datetime64[Y]').astype(np.int64)
+
+
+class KeyCounts(object):
+    """Counts of int64 keys over many batches.
+
+    Each batch is merged into the running counts, so memory is bounded by
+    the number of distinct keys rather than the number of rows.
+    """
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, keys, distinct=False):
+        """Count ``keys``; with ``distinct``, only whether a key was seen at all."""
+        keys, counts = np.unique(keys, return_counts=True)
+        if distinct:
+            counts = np.ones_like(counts)
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        self.counts = np.bincount(inverse, np.concatenate([self.counts, counts]),
+                                  minlength=len(keys)).astype(np.int64)
+        if distinct:
+            self.counts = np.minimum(self.counts, 1)
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.keys)
+
+
+# ----------------------------------------------------------------------------#
+# Reports.
+# ----------------------------------------------------------------------------#
+
+def venue_months(connection, since, until, batch_size):
+    venues = load_venues(connection)
+    counts = KeyCounts()
+    for venue_ids, _, starts in show_batches(connection, since, until, batch_size):
+        counts.add(venues.positions(venue_ids) * MONTH_SPAN + _months(starts) + MONTH_OFFSET)
+
+    venue, month = np.divmod(counts.keys, MONTH_SPAN)
+    month -= MONTH_OFFSET
+    name_rank = np.argsort(np.argsort(np.array([(name or '').lower() for name in venues.names], dtype=object)))
+    order = np.lexsort((month, name_rank[venue]))
+    months = month.astype('datetime64[M]').astype(str).tolist()
+    columns = ['venue_id', 'venue', 'city', 'state', 'month', 'shows']
+    rows = [[int(venues.ids[v]), venues.names[v], venues.city_names[v],
+             venues.states[venues.state[v]], months[i], int(counts.counts[i])]
+            for i, v in zip(order.tolist(), venue[order].tolist())]
+    return columns, rows
+
+
+def genre_trends(connection, since, until, batch_size):
+    venues = load_venues(connection)
+    artists = load_artists(connection)
+    n_genres = max(len(artists.genres), 1)
+    pairs, totals = KeyCounts(), KeyCounts()
+    for venue_ids, artist_ids, starts in show_batches(connection, since, until, batch_size):
+        state = venues.state[venues.positions(venue_ids)]
+        year = _years(starts) + YEAR_OFFSET
+        rows, genre = _genres_of(artists, artists.positions(artist_ids))
+        pairs.add((state[rows] * n_genres + genre) * YEAR_SPAN + year[rows])
+        totals.add(state * YEAR_SPAN + year)
+
+    state_genre, year = np.divmod(pairs.keys, YEAR_SPAN)
+    state, genre = np.divmod(state_genre, n_genres)
+    # share of the state's shows that year, and change from the year before
+    state_totals = totals.counts[np.searchsorted(totals.keys, state * YEAR_SPAN + year)]
+    share = 100.0 * pairs.counts / state_totals
+    previous = np.searchsorted(pairs.keys, pairs.keys - 1)
+    had_previous = (previous < len(pairs)) & (pairs.keys[np.minimum(previous, len(pairs) - 1)] == pairs.keys - 1)
+    change = np.where(had_previous, pairs.counts - pairs.counts[np.minimum(previous, len(pairs) - 1)], 0)
+
+    genre_rank = np.argsort(np.argsort(np.array([g.lower() for g in artists.genres] or [''], dtype=object)))
+    order = np.lexsort((year, genre_rank[genre], state))
+    columns = ['state', 'genre', 'year', 'shows', 'share_percent', 'change']
+    rows = [[venues.states[s], artists.genres[g], int(y) - YEAR_OFFSET + 1970, int(pairs.counts[i]),
+             round(float(share[i]), 1), int(change[i]) if had_previous[i] else None]
+            for i, s, g, y in zip(order.tolist(), state[order].tolist(), genre[order].tolist(),
+                                  year[order].tolist())]
+    return columns, rows
+
+
+def touring_density(connection, since, until, batch_size):
+    venues = load_venues(connection)
+    artists = load_artists(connection)
+    n = len(artists)
+    shows = np.zeros(n, dtype=np.int64)
+    first = np.full(n, np.iinfo(np.int64).max)
+    last = np.full(n, np.iinfo(np.int64).min)
+    seen_venues, seen_cities, seen_states = KeyCounts(), KeyCounts(), KeyCounts()
+    for venue_ids, artist_ids, starts in show_batches(connection, since, until, batch_size):
+        artist = artists.positions(artist_ids)
+        venue = venues.positions(venue_ids)
+        shows += np.bincount(artist, minlength=n)
+        # per-artist min and max of the batch, over runs of the sorted positions
+        order = np.argsort(artist, kind='stable')
+        grouped, times = artist[order], starts[order]
+        bounds = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+        ids = grouped[bounds]
+        first[ids] = np.minimum(first[ids], np.minimum.reduceat(times, bounds))
+        last[ids] = np.maximum(last[ids], np.maximum.reduceat(times, bounds))
+        seen_venues.add(artist * len(venues) + venue, distinct=True)
+        seen_cities.add(artist * len(venues.cities) + venues.city[venue], distinct=True)
+        seen_states.add(artist * len(venues.states) + venues.state[venue], distinct=True)
+
+    touring = np.flatnonzero(shows)
+    venue_counts = np.bincount(seen_venues.keys // max(len(venues), 1), minlength=n)
+    city_counts = np.bincount(seen_cities.keys // max(len(venues.cities), 1), minlength=n)
+    state_counts = np.bincount(seen_states.keys // max(len(venues.states), 1), minlength=n)
+    # shows per month between the first and the last, counting at least a month
+    months = np.maximum((last[touring] - first[touring]) / (86400 * 30.4375), 1.0)
+    density = shows[touring] / months
+    order = np.lexsort((-shows[touring], -density))
+    firsts = first[touring].astype('datetime64[s]').astype('datetime64[D]').astype(str).tolist()
+    lasts = last[touring].astype('datetime64[s]').astype('datetime64[D]').astype(str).tolist()
+    columns = ['artist_id', 'artist', 'shows', 'venues', 'cities', 'states',
+               'first_show', 'last_show', 'shows_per_month']
+    rows = [[int(artists.ids[a]), artists.names[a], int(shows[a]), int(venue_counts[a]),
+             int(city_counts[a]), int(state_counts[a]), firsts[i], lasts[i], round(float(density[i]), 2)]
+            for i, a in zip(order.tolist(), touring[order].tolist())]
+    return columns, rows
+
+
+# name: (title, description, function)
+REPORTS = {
+    'venue-months': ('Shows per venue per month',
+                     'How many shows each venue hosts, month by month.', venue_months),
+    'genre-trends': ('Genre trends by state',
+                     "Shows per genre in each state and year, as a share of the state's shows "
+                     'and against the year before.', genre_trends),
+    'touring-density': ('Artist touring density',
+                        'How many shows, venues and cities each artist plays, and how many '
+                        'shows a month between their first and last.', touring_density),
+}
+
+
+def compute(name, since=None, until=None, batch_size=100000):
+    """Run a report in one repeatable-read snapshot, and keep that snapshot
+    with the result: it is current until a change commits that it does not
+    see."""
+    function = REPORTS[name][2]
+    started = time.perf_counter()
+    with db.engine.execution_options(isolation_level='REPEATABLE READ').connect() as connection:
+        with connection.begin():
+            snapshot = changes.current_snapshot(connection)
+            columns, rows = function(connection, since, until, batch_size)
+    seconds = time.perf_counter() - started
+    REPORT_SECONDS.labels(name).observe(seconds)
+    return {
+        'columns': columns,
+        'rows': rows,
+        'snapshot': snapshot,
+        'computed_at': datetime.now().isoformat(timespec='seconds'),
+        'seconds': round(seconds, 3),
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Result cache.
+# ----------------------------------------------------------------------------#
+
+class ReportCache(object):
+    """Computed reports on disk, shared by all workers of a host.
+
+    There is one file per report and parameters; a result is served until
+    a venue, artist or show change commits after the snapshot it was
+    computed in (see changes.py). A lock file per key lets one worker
+    compute a missing or outdated report while the others wait for it.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key, suffix='.json'):
+        return os.path.join(self.directory, key + suffix)
+
+    def get(self, key):
+        try:
+            with open(self._path(key)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set(self, key, value):
+        write_atomic(self._path(key), json.dumps(value))
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path(key, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _key(name, since, until):
+    params = hashlib.sha1(f'{since}|{until}'.encode('utf-8')).hexdigest()[:8]
+    return f'{name}-{params}'
+
+
+def _current(result):
+    if result is None or not result.get('snapshot'):
+        return False
+    with db.engine.connect() as connection:
+        return not changes.changed_since(connection, result['snapshot'])
+
+
+def report(name, since=None, until=None):
+    """The report, from the cache when the data has not changed since."""
+    cache = current_app.extensions['report_cache']
+    key = _key(name, since, until)
+    result = cache.get(key)
+    if _current(result):
+        return result
+    with cache.lock(key):
+        result = cache.get(key)
+        if not _current(result):
+            result = compute(name, since, until, current_app.config.get('ANALYTICS_BATCH_SIZE', 100000))
+            cache.set(key, result)
+    return result
+
+
+def parse_month(value):
+    """'2026-10' as the first moment of that month, or None."""
+    return datetime.strptime(value, '%Y-%m') if value else None
+
+
+def write_csv(result, out):
+    writer = csv.writer(out)
+    writer.writerow(result['columns'])
+    writer.writerows(result['rows'])
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+def _report_args(name):
+    if name not in REPORTS:
+        abort(404)
+    try:
+        return parse_month(request.args.get('since')), parse_month(request.args.get('until'))
+    except ValueError:
+        abort(400)
+
+
+def reports():
+    return render_template('pages/reports.html', reports=REPORTS)
+
+
+def report_page(name):
+    since, until = _report_args(name)
+    result = report(name, since, until)
+    limit = current_app.config.get('ANALYTICS_PAGE_ROWS', 500)
+    return render_template('pages/report.html', name=name, title=REPORTS[name][0],
+                           description=REPORTS[name][1], result=result, rows=result['rows'][:limit],
+                           since=request.args.get('since', ''), until=request.args.get('until', ''),
+                           csv_url=url_for('report_csv', name=name, since=request.args.get('since') or None,
+                                           until=request.args.get('until') or None))
+
+
+def report_csv(name):
+    since, until = _report_args(name)
+    result = report(name, since, until)
+
+    def generate(batch=1000):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(result['columns'])
+        rows = result['rows']
+        for start in range(0, len(rows), batch):
+            writer.writerows(rows[start:start + batch])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.csv"'
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+analytics_cli = AppGroup('analytics', help='Compute the booking reports.')
+
+
+@analytics_cli.command('report')
+@click.argument('name', type=click.Choice(sorted(REPORTS)))
+@click.option('--since', type=click.DateTime(formats=['%Y-%m']), default=None,
+              help="First month included, e.g. '2026-01'.")
+@click.option('--until', type=click.DateTime(formats=['%Y-%m']), default=None,
+              help='First month no longer included.')
+@click.option('--output', type=click.Path(dir_okay=False), default=None,
+              help='CSV file to write; standard output by default.')
+def report_command(name, since, until, output):
+    """Compute a report (or take it from the cache) as CSV."""
+    result = report(name, since, until)
+    if output is None:
+        write_csv(result, sys.stdout)
+        return
+    with open(output, 'w', newline='') as f:
+        write_csv(result, f)
+    click.echo(f"{name}: {len(result['rows'])} rows in {result['seconds']} s, written to {output}")
+
+
+@analytics_cli.command('warm')
+def warm_command():
+    """Compute every report over all shows, so pages are served from the
+    cache; run from cron after the data changes."""
+    for name in REPORTS:
+        result = report(name)
+        click.echo(f"{name}: {len(result['rows'])} rows, computed {result['computed_at']} "
+                   f"in {result['seconds']} s")
+
+
+def init_app(app):
+    app.extensions['report_cache'] = ReportCache(app.config['ANALYTICS_CACHE_DIR'])
+    app.add_url_rule('/reports', 'reports', reports)
+    app.add_url_rule('/reports/<name>', 'report', report_page)
+    app.add_url_rule('/reports/<name>.csv', 'report_csv', report_csv)
+    app.cli.add_command(analytics_cli)
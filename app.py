@@ -2,26 +2,51 @@
 # Imports
 # ----------------------------------------------------------------------------#
 
+import os
 import sys
+from datetime import datetime
 import dateutil.parser
-import babel
-from flask import render_template, request, flash, redirect, url_for, abort
+import babel.dates
+from flask import Blueprint, current_app, render_template, request, flash, redirect, url_for, abort, jsonify
 import logging
-from logging import Formatter, FileHandler
+from logging import Formatter, FileHandler, StreamHandler
 from flask import Flask
+from flask.logging import default_handler
 from flask_moment import Moment
 from flask_migrate import Migrate
-from models import *
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy import delete, func
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Venue, Artist, Show
+import analytics
+import assets
+import async_views
+import cache
+import changes
+import compression
+import config
+import dashboard
+import fulltext
+import invalidation
+import live
+import metrics
+import partitions
+import profiling
+import ratelimit
+import recommendations
+import sitemap
+import slowlog
+import snapshots
+import startup
 
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
+# The app itself is built by create_app() at the bottom of this file.
+bp = Blueprint('main', __name__)
+moment = Moment()
+migrate = Migrate()
 
 
 # Database connection done in config.py
@@ -39,21 +64,23 @@ def format_datetime(value, format='medium'):
     return babel.dates.format_datetime(date, format, locale='en')
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+bp.add_app_template_filter(format_datetime, 'datetime')
 
 
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
-    return render_template('pages/home.html')
+    # served from the dashboard materialized views, see dashboard.py
+    data = dashboard.dashboard(db.session, limit=current_app.config.get('DASHBOARD_LIMIT', 6))
+    return render_template('pages/home.html', dashboard=data)
 
 
 #  Venues display DONE
 #  ----------------------------------------------------------------
-@app.route('/venues')
+@bp.route('/venues')
 def venues():
     error = False
     data = []
@@ -69,13 +96,16 @@ def venues():
                 'state': place[1],
                 "venues": []
             })
-        # num_upcoming_shows based on number of upcoming shows per venue
+        # num_upcoming_shows based on number of upcoming shows per venue, counted
+        # in one query whose start_time bound lets Postgres skip past partitions
+        upcoming = dict(
+            db.session.query(Show.venue_id, func.count(Show.id))
+            .filter(Show.start_time > datetime.now())
+            .group_by(Show.venue_id)
+            .all()
+        )
         for venue in venues:
-            num_upcoming_shows = 0
-            shows = Show.query.all()
-            for show in shows:
-                if show.start_time > datetime.now():
-                    num_upcoming_shows += 1
+            num_upcoming_shows = upcoming.get(venue.id, 0)
             for venue_places in data:
                 if venue.state == venue_places['state'] and venue.city == venue_places['city']:
                     venue_places['venues'].append({
@@ -90,41 +120,44 @@ def venues():
         return render_template('pages/venues.html', areas=data)
 
 
+#  Search Venues & Artists
+#  ----------------------------------------------------------------
+@bp.route('/search')
+def search():
+    # /search?q=jazz san francisco&type=venue&page=2, type and page optional
+    args = fulltext.parse_args(request.args, current_app.config)
+    response = fulltext.search(db.session, **args)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(response)
+    return render_template('pages/search.html', results=response, **args)
+
+
 #  Search Venue DONE
 #  ----------------------------------------------------------------
-@app.route('/venues/search', methods=['POST'])
+@bp.route('/venues/search', methods=['POST'])
 def search_venues():
-    search_term = request.form.get('search_term', '').lower()
-    search_result = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()
-    response = {
-        "count": len(search_result),
-        "data": search_result
-    }
+    search_term = request.form.get('search_term', '').strip()
+    response = fulltext.search(db.session, search_term, ['venue'],
+                               per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
     return render_template('pages/search_venues.html', results=response,
                            search_term=search_term)
 
 
 #  Show Venue bi ID DONE
 #  ----------------------------------------------------------------
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    shows = Show.query.filter_by(venue_id=venue_id).all()
-    upcoming_shows = []
-    past_shows = []
-
-    # past & upcoming shows
-    for show in shows:
-        data = {
+def venue_page(venue, past, upcoming):
+    # shared with the async view in async_views.py
+    def show_data(show):
+        return {
             "artist_id": show.artist_id,
             "artist_name": show.artist.name,
             "artist_image_link": show.artist.image_link,
             "start_time": format_datetime(str(show.start_time)),
         }
-        if show.start_time > datetime.now():
-            upcoming_shows.append(data)
-        else:
-            past_shows.append(data)
+
+    # past & upcoming shows
+    upcoming_shows = [show_data(show) for show in upcoming]
+    past_shows = [show_data(show) for show in past]
 
     data = {
         "id": venue.id,
@@ -144,18 +177,32 @@ def show_venue(venue_id):
         "past_shows_count": len(past_shows),
         "upcoming_shows_count": len(upcoming_shows),
     }
-    return render_template('pages/show_venue.html', venue=data)
+    return data
+
+
+@bp.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    venue = Venue.query.get(venue_id)
+    # separate bounded queries so each only scans the partitions it needs
+    now = datetime.now()
+    upcoming = Show.query.filter(Show.venue_id == venue_id, Show.start_time > now).all()
+    past = Show.query.filter(Show.venue_id == venue_id, Show.start_time <= now).all()
+    similar = db.session.execute(recommendations.similar_statement('venue', venue_id)).all()
+    return render_template('pages/show_venue.html', venue=venue_page(venue, past, upcoming),
+                           similar=similar)
 
 
 #  Create Venue DONE
 #  ----------------------------------------------------------------
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
+    # forms pull in wtforms/phonenumbers, so import them on first use
+    from forms import VenueForm
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     # Venue Creation implemented
     error = False
@@ -192,36 +239,77 @@ def create_venue_submission():
     else:
         # on successful db insert, flash success
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
-        return render_template('pages/home.html')
+    return redirect(url_for('.index'))
 
 
 #  Delete Venue DONE
 #  ----------------------------------------------------------------
-@app.route('/venues/<venue_id>/delete/', methods=['DELETE'])
+@bp.route('/venues/<venue_id>/delete/', methods=['DELETE'])
 def delete_venue(venue_id):
-    # Venue deletion controller & vue implementation with session commit error handling
+    # Shows go with the venue through ON DELETE CASCADE: one statement, one round trip
     error = False
-    venue = Venue.query.get(venue_id)
+    name = None
     try:
-        for show in venue.shows:
-            db.session.delete(show)
-        db.session.delete(venue)
+        name = db.session.execute(
+            delete(Venue).where(Venue.id == venue_id).returning(Venue.name)
+        ).scalar()
+        invalidation.mark(db.session, 'venue', [venue_id])
         db.session.commit()
-    except():
+    except SQLAlchemyError:
         db.session.rollback()
         error = True
+        print(sys.exc_info())
     finally:
         db.session.close()
     if error:
-        flash('An error occurred. Venue ' + venue.name + ' was not deleted.')
+        flash('An error occurred. Venue ' + str(venue_id) + ' was not deleted.')
+    elif name is None:
+        abort(404)
     else:
-        flash('Venue ' + venue.name + ' was successfully deleted.')
-        return redirect(url_for('venues'))
+        flash('Venue ' + name + ' was successfully deleted.')
+    return redirect(url_for('.venues'))
+
+
+#  Bulk Delete Venues & Artists
+#  ----------------------------------------------------------------
+def bulk_delete(model, kind):
+    # ids come as a JSON body {"ids": [...]} or as repeated "ids" form fields
+    payload = request.get_json(silent=True)
+    ids = payload.get('ids') if isinstance(payload, dict) else request.form.getlist('ids')
+    try:
+        ids = [int(entity_id) for entity_id in ids or []]
+    except (TypeError, ValueError):
+        abort(400)
+    if not ids:
+        abort(400)
+    try:
+        deleted = db.session.execute(
+            delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+        ).rowcount
+        invalidation.mark(db.session, kind, ids)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        print(sys.exc_info())
+        abort(500)
+    finally:
+        db.session.close()
+    return jsonify({'deleted': deleted})
+
+
+@bp.route('/venues/delete', methods=['POST', 'DELETE'])
+def delete_venues():
+    return bulk_delete(Venue, 'venue')
+
+
+@bp.route('/artists/delete', methods=['POST', 'DELETE'])
+def delete_artists():
+    return bulk_delete(Artist, 'artist')
 
 
 #  Artists display DONE
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
 def artists():
     error = False
     data = []
@@ -240,41 +328,30 @@ def artists():
 
 #  Search Artist DONE
 #  ----------------------------------------------------------------
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
 def search_artists():
-    search_term = request.form.get('search_term', '').lower()
-    search_result = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
-
-    response = {
-        "count": len(search_result),
-        "data": search_result
-    }
+    search_term = request.form.get('search_term', '').strip()
+    response = fulltext.search(db.session, search_term, ['artist'],
+                               per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
     return render_template('pages/search_artists.html', results=response,
                            search_term=search_term)
 
 
 # Display Artist by ID DONE
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-    # shows the artist page with the given artist_id
-    artist = Artist.query.get(artist_id)
-    shows = Show.query.filter_by(artist_id=artist_id).all()
-    upcoming_shows = []
-    past_shows = []
-
-    # past & upcoming shows
-    for show in shows:
-        data = {
+def artist_page(artist, past, upcoming):
+    # shared with the async view in async_views.py
+    def show_data(show):
+        return {
             "venue_id": show.venue_id,
             "venue_name": show.venue.name,
             "venue_image_link": show.venue.image_link,
             "start_time": format_datetime(str(show.start_time)),
         }
-        if show.start_time > datetime.now():
-            upcoming_shows.append(data)
-        else:
-            past_shows.append(data)
+
+    # past & upcoming shows
+    upcoming_shows = [show_data(show) for show in upcoming]
+    past_shows = [show_data(show) for show in past]
 
     data = {
         "id": artist.id,
@@ -293,7 +370,20 @@ def show_artist(artist_id):
         "past_shows_count": len(past_shows),
         "upcoming_shows_count": len(upcoming_shows),
     }
-    return render_template('pages/show_artist.html', artist=data)
+    return data
+
+
+@bp.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    # shows the artist page with the given artist_id
+    artist = Artist.query.get(artist_id)
+    # separate bounded queries so each only scans the partitions it needs
+    now = datetime.now()
+    upcoming = Show.query.filter(Show.artist_id == artist_id, Show.start_time > now).all()
+    past = Show.query.filter(Show.artist_id == artist_id, Show.start_time <= now).all()
+    similar = db.session.execute(recommendations.similar_statement('artist', artist_id)).all()
+    return render_template('pages/show_artist.html', artist=artist_page(artist, past, upcoming),
+                           similar=similar)
 
 
 # ----------------------------------------------------------------------------#
@@ -302,8 +392,9 @@ def show_artist(artist_id):
 
 #  Update Artist DONE
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
+    from forms import ArtistForm
     form = ArtistForm()
     artist = Artist.query.get(artist_id)
     data = {
@@ -322,7 +413,7 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=data)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     error = False
     artist = Artist.query.get(artist_id)
@@ -367,13 +458,14 @@ def edit_artist_submission(artist_id):
     else:
         # on successful db update, flash success
         flash('Artist ' + request.form['name'] + ' was successfully updated!')
-        return redirect(url_for('show_artist', artist_id=artist_id))
+        return redirect(url_for('.show_artist', artist_id=artist_id))
 
 
 #  Update Venue DONE
 #  ----------------------------------------------------------------
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
+    from forms import VenueForm
     form = VenueForm()
     venue = Venue.query.get(venue_id)
     data = {
@@ -393,7 +485,7 @@ def edit_venue(venue_id):
     return render_template('forms/edit_venue.html', form=form, venue=data)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     error = False
     venue = Venue.query.get(venue_id)
@@ -440,18 +532,19 @@ def edit_venue_submission(venue_id):
     else:
         # on successful db update, flash success
         flash('Venue ' + request.form['name'] + ' was successfully updated!')
-        return redirect(url_for('show_venue', venue_id=venue_id))
+        return redirect(url_for('.show_venue', venue_id=venue_id))
 
 
 #  Create Artist DONE
 #  ----------------------------------------------------------------
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
+    from forms import ArtistForm
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     # Artist Creation implemented
     error = False
@@ -487,36 +580,40 @@ def create_artist_submission():
     else:
         # on successful db insert, flash success
         flash('Artist ' + request.form['name'] + ' was successfully listed!')
-        return render_template('pages/home.html')
+    return redirect(url_for('.index'))
 
 
 #  Delete Artist DONE
 #  ----------------------------------------------------------------
-@app.route('/artists/<artist_id>/delete/', methods=['DELETE'])
+@bp.route('/artists/<artist_id>/delete/', methods=['DELETE'])
 def delete_artist(artist_id):
-    # Artist deletion controller & vue implementation with session commit error handling
+    # Shows go with the artist through ON DELETE CASCADE: one statement, one round trip
     error = False
-    artist = Artist.query.get(artist_id)
+    name = None
     try:
-        for show in artist.shows:
-            db.session.delete(show)
-        db.session.delete(artist)
+        name = db.session.execute(
+            delete(Artist).where(Artist.id == artist_id).returning(Artist.name)
+        ).scalar()
+        invalidation.mark(db.session, 'artist', [artist_id])
         db.session.commit()
-    except():
+    except SQLAlchemyError:
         db.session.rollback()
         error = True
+        print(sys.exc_info())
     finally:
         db.session.close()
     if error:
-        flash('An error occurred. Artist ' + artist.name + ' was not deleted.')
+        flash('An error occurred. Artist ' + str(artist_id) + ' was not deleted.')
+    elif name is None:
+        abort(404)
     else:
-        flash('Artist ' + artist.name + ' was successfully deleted.')
-        return redirect(url_for('show_artist'))
+        flash('Artist ' + name + ' was successfully deleted.')
+    return redirect(url_for('.artists'))
 
 
 #  Display Shows DONE
 #  ----------------------------------------------------------------
-@app.route('/shows')
+@bp.route('/shows')
 def shows():
     # Display Shows order by Start Date Desc
     shows = Show.query.order_by(Show.start_time.desc()).all()
@@ -525,6 +622,7 @@ def shows():
     try:
         for show in shows:
             data.append({
+                "id": show.id,
                 "venue_id": show.venue_id,
                 "venue_name": show.venue.name,
                 "artist_id": show.artist_id,
@@ -542,14 +640,15 @@ def shows():
 
 #  Create Show DONE
 #  ----------------------------------------------------------------
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
     # renders form. do not touch.
+    from forms import ShowForm
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
     # Show Creation implemented
     error = False
@@ -572,12 +671,12 @@ def create_show_submission():
     else:
         # on successful db insert, flash success
         flash('Show was successfully listed!')
-        return render_template('pages/home.html')
+    return redirect(url_for('.index'))
 
 
 #  Search Show DONE
 #  ----------------------------------------------------------------
-@app.route('/shows/search', methods=['POST'])
+@bp.route('/shows/search', methods=['POST'])
 def search_shows():
     search_term = request.form.get('search_term', '').lower()
     search_result = Show.query.filter(Artist.name.ilike(f'%{search_term}%')).all()
@@ -594,28 +693,83 @@ def search_shows():
 #  Error Handling
 # ----------------------------------------------------------------------------#
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# App Factory.
+# ----------------------------------------------------------------------------#
+
+def create_app(profile=None):
+    """Build the app for a config profile, by default the one named by FYYUR_ENV."""
+    app = Flask(__name__)
+    app.config.from_object(config.profiles[profile or os.environ.get('FYYUR_ENV', 'development')])
+    if not app.config['SECRET_KEY']:
+        app.config['SECRET_KEY'] = config.load_secret_key(create=app.config['SECRET_KEY_CREATE'])
+    # client address, scheme and host from the proxies in front, if trusted
+    proxies = dict(x_for=app.config.get('PROXY_FIX_X_FOR', 0),
+                   x_proto=app.config.get('PROXY_FIX_X_PROTO', 0),
+                   x_host=app.config.get('PROXY_FIX_X_HOST', 0))
+    if any(proxies.values()):
+        app.wsgi_app = ProxyFix(app.wsgi_app, **proxies)
+    moment.init_app(app)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    # crawlers served from snapshots skip rate limiting and load shedding
+    snapshots.init_app(app)
+    ratelimit.init_app(app)
+    cache.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+    live.init_app(app)
+    dashboard.init_app(app)
+    invalidation.bus.init_app(app)
+    metrics.init_app(app)
+    partitions.init_app(app)
+    slowlog.init_app(app)
+    profiling.init_app(app)
+    recommendations.init_app(app)
+    analytics.init_app(app)
+    changes.init_app(app)
+    sitemap.init_app(app)
+    startup.init_app(app)
+    app.register_blueprint(bp)
+    async_views.init_app(app)
+
+    if not app.debug:
+        # stderr unless ERROR_LOG names a file; app.logger is shared by every
+        # app built in this process, so a previous app's handler is replaced
+        previous = getattr(app.logger, 'error_handler', None)
+        if previous is not None:
+            app.logger.removeHandler(previous)
+            previous.close()
+        path = app.config.get('ERROR_LOG')
+        handler = FileHandler(path) if path else StreamHandler()
+        handler.setFormatter(
+            Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+        )
+        app.logger.setLevel(logging.INFO)
+        handler.setLevel(logging.INFO)
+        app.logger.addHandler(handler)
+        app.logger.error_handler = handler
+        # this handler alone: not Flask's default one, nor the root
+        # logger's that gunicorn or the caller may have set up
+        app.logger.removeHandler(default_handler)
+        app.logger.propagate = False
+        app.logger.info('errors')
+    return app
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
 if __name__ == '__main__':
-    app.run()
+    # development server only; production runs wsgi.py under gunicorn
+    create_app().run()
@@ -0,0 +1,215 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+import click
+from flask import abort, current_app, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+
+# ----------------------------------------------------------------------------#
+# Bundles.
+# ----------------------------------------------------------------------------#
+
+# bundle name -> source files, relative to static/, in load order
+BUNDLES = {
+    'main.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'form.css': [
+        'css/font-awesome.min.css',
+        'css/bootstrap.min.css',
+        'css/bootstrap-theme.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    # the scripts each layout loaded before bundling, in the same order
+    'main-head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    'main.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+    'form-head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+    ],
+    'form.js': [
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+        'js/script.js',
+    ],
+}
+
+MANIFEST = 'manifest.json'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_css_comment = re.compile(r'/\*(?!!).*?\*/', re.S)
+_css_url = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+# ----------------------------------------------------------------------------#
+# Build.
+# ----------------------------------------------------------------------------#
+
+def _minify_css(source):
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    # without rcssmin, only what is safe everywhere: whitespace is
+    # significant in selectors ('.nav :hover' is not '.nav:hover')
+    source = _css_comment.sub('', source)
+    return re.sub(r'\s+', ' ', source).strip()
+
+
+def _minify_js(source):
+    # without rjsmin the sources are only concatenated; the large libraries
+    # are shipped pre-minified anyway
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    return source.strip()
+
+
+def _absolute_urls(source, path, static_url):
+    """Rewrite relative ``url()`` references so they survive the move to dist/."""
+    base = posixpath.dirname(path)
+
+    def rewrite(match):
+        quote, target = match.groups()
+        if target.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        resolved = posixpath.normpath(posixpath.join(base, target))
+        return f'url({quote}{static_url}/{resolved}{quote})'
+
+    return _css_url.sub(rewrite, source)
+
+
+def _bundle(static_folder, static_url, name, sources):
+    parts = []
+    for path in sources:
+        with open(os.path.join(static_folder, path), encoding='utf-8') as f:
+            source = f.read()
+        if name.endswith('.css'):
+            parts.append(_minify_css(_absolute_urls(source, path, static_url)))
+        else:
+            parts.append(_minify_js(source))
+    # guard against sources that end without a semicolon
+    separator = '\n' if name.endswith('.css') else ';\n'
+    return separator.join(parts).encode('utf-8')
+
+
+def build(app):
+    """Bundle, minify and fingerprint every entry of BUNDLES.
+
+    Writes ``<name>.<hash>.<ext>`` plus ``.gz`` (and ``.br`` when brotli is
+    installed) variants into ASSETS_DIST_DIR, and records the mapping from
+    bundle name to fingerprinted file in the manifest.
+    """
+    dist = app.config['ASSETS_DIST_DIR']
+    os.makedirs(dist, exist_ok=True)
+    manifest = {}
+    for name, sources in BUNDLES.items():
+        content = _bundle(app.static_folder, app.static_url_path, name, sources)
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        filename = f'{stem}.{digest}{ext}'
+        path = os.path.join(dist, filename)
+        with open(path, 'wb') as f:
+            f.write(content)
+        with open(path + '.gz', 'wb') as f:
+            f.write(gzip.compress(content, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(path + '.br', 'wb') as f:
+                f.write(brotli.compress(content, quality=11))
+        manifest[name] = filename
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _load_manifest(app):
+    try:
+        with open(os.path.join(app.config['ASSETS_DIST_DIR'], MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# ----------------------------------------------------------------------------#
+# Serving.
+# ----------------------------------------------------------------------------#
+
+def serve_asset(filename):
+    dist = current_app.config['ASSETS_DIST_DIR']
+    path = os.path.join(dist, filename)
+    # only fingerprinted build outputs are served from here
+    if os.path.dirname(filename) or filename == MANIFEST or not os.path.isfile(path):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            encoding, path = candidate, path + suffix
+            break
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        del response.headers['Content-Disposition']
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def init_app(app):
+    app.config.setdefault('ASSETS_DIST_DIR', os.path.join(app.static_folder, 'dist'))
+    manifest = _load_manifest(app)
+
+    def asset_urls(name):
+        """URLs to load for a bundle: the fingerprinted build, or its sources."""
+        if name in manifest:
+            return [url_for('asset', filename=manifest[name])]
+        return [url_for('static', filename=path) for path in BUNDLES[name]]
+
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    app.add_url_rule('/assets/<path:filename>', 'asset', serve_asset)
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Bundle, minify, fingerprint and precompress static assets."""
+        manifest.clear()
+        manifest.update(build(app))
+        for name, filename in sorted(manifest.items()):
+            click.echo(f'{name} -> {filename}')
@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import asyncio
+import os
+import threading
+from datetime import datetime
+
+from flask import abort, current_app, jsonify, render_template, request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import configure_mappers, joinedload, sessionmaker
+
+import fulltext
+import recommendations
+from models import Venue, Artist, Show
+
+
+# ----------------------------------------------------------------------------#
+# Event loop.
+# ----------------------------------------------------------------------------#
+
+class LoopRunner(object):
+    """One event loop per worker process, running on a background thread.
+
+    Flask hands every ``async def`` view to ``app.async_to_sync``; the default
+    starts a fresh loop per request, which rules out a connection pool since
+    asyncpg connections are bound to the loop that opened them. Here all the
+    request threads of a worker submit their coroutines to the same loop, so
+    the asyncpg pool is shared and the queries of all in-flight requests are
+    multiplexed on it.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        # started lazily so that gunicorn workers each get their own after fork
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._loop = asyncio.new_event_loop()
+                    threading.Thread(target=self._loop.run_forever,
+                                     name='async-views', daemon=True).start()
+                    self._pid = os.getpid()
+        return self._loop
+
+    def run(self, coro):
+        # call_soon_threadsafe copies the caller's context, so the coroutine
+        # still sees Flask's app and request context
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def async_to_sync(self, func):
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+
+runner = LoopRunner()
+
+
+# ----------------------------------------------------------------------------#
+# Database.
+# ----------------------------------------------------------------------------#
+
+class AsyncDatabase(object):
+    def __init__(self):
+        self._sessionmaker = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.uri = app.config.get('ASYNC_DATABASE_URI') or \
+            app.config['SQLALCHEMY_DATABASE_URI'].replace('postgresql://', 'postgresql+asyncpg://', 1)
+        self.options = app.config.get('ASYNC_ENGINE_OPTIONS', {})
+
+    def session(self):
+        """A new session; open one per concurrent query, they cannot be shared."""
+        if self._pid != os.getpid():
+            engine = create_async_engine(self.uri, **self.options)
+            self._sessionmaker = sessionmaker(engine, class_=AsyncSession,
+                                              expire_on_commit=False)
+            self._pid = os.getpid()
+        return self._sessionmaker()
+
+    async def all(self, statement):
+        async with self.session() as session:
+            return (await session.execute(statement)).all()
+
+    async def scalars(self, statement):
+        async with self.session() as session:
+            return (await session.execute(statement)).unique().scalars().all()
+
+    async def scalar(self, statement):
+        async with self.session() as session:
+            return (await session.execute(statement)).unique().scalar()
+
+
+adb = AsyncDatabase()
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+async def venues():
+    rows, counts = await asyncio.gather(
+        adb.all(select(Venue.id, Venue.name, Venue.city, Venue.state)),
+        adb.all(select(Show.venue_id, func.count())
+                .where(Show.start_time > datetime.now())
+                .group_by(Show.venue_id)),
+    )
+    upcoming = dict(counts)
+    areas = {}
+    for venue_id, name, city, state in rows:
+        area = areas.setdefault((city, state), {'city': city, 'state': state, 'venues': []})
+        area['venues'].append({
+            'id': venue_id,
+            'name': name,
+            'num_upcoming_shows': upcoming.get(venue_id, 0),
+        })
+    return render_template('pages/venues.html', areas=list(areas.values()))
+
+
+async def search_results(term, kinds, page=1, per_page=20):
+    rows, count = fulltext.statements(term, kinds, page, per_page)
+    rows, total = await asyncio.gather(adb.all(rows), adb.scalar(count))
+    return fulltext.results(rows, total, page, per_page)
+
+
+async def search():
+    args = fulltext.parse_args(request.args, current_app.config)
+    response = await search_results(**args)
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(response)
+    return render_template('pages/search.html', results=response, **args)
+
+
+async def search_venues():
+    search_term = request.form.get('search_term', '').strip()
+    response = await search_results(search_term, ['venue'],
+                                    per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
+    return render_template('pages/search_venues.html', results=response,
+                           search_term=search_term)
+
+
+async def show_venue(venue_id):
+    from app import venue_page
+    now = datetime.now()
+    shows = select(Show).options(joinedload(Show.artist)).where(Show.venue_id == venue_id)
+    venue, upcoming, past, similar = await asyncio.gather(
+        adb.scalar(select(Venue).where(Venue.id == venue_id)),
+        adb.scalars(shows.where(Show.start_time > now)),
+        adb.scalars(shows.where(Show.start_time <= now)),
+        adb.all(recommendations.similar_statement('venue', venue_id)),
+    )
+    if venue is None:
+        abort(404)
+    return render_template('pages/show_venue.html', venue=venue_page(venue, past, upcoming),
+                           similar=similar)
+
+
+async def artists():
+    rows = await adb.all(select(Artist.id, Artist.name))
+    data = [{"id": artist_id, "name": name} for artist_id, name in rows]
+    return render_template('pages/artists.html', artists=data)
+
+
+async def search_artists():
+    search_term = request.form.get('search_term', '').strip()
+    response = await search_results(search_term, ['artist'],
+                                    per_page=current_app.config.get('SEARCH_PER_PAGE', 20))
+    return render_template('pages/search_artists.html', results=response,
+                           search_term=search_term)
+
+
+async def show_artist(artist_id):
+    from app import artist_page
+    now = datetime.now()
+    shows = select(Show).options(joinedload(Show.venue)).where(Show.artist_id == artist_id)
+    artist, upcoming, past, similar = await asyncio.gather(
+        adb.scalar(select(Artist).where(Artist.id == artist_id)),
+        adb.scalars(shows.where(Show.start_time > now)),
+        adb.scalars(shows.where(Show.start_time <= now)),
+        adb.all(recommendations.similar_statement('artist', artist_id)),
+    )
+    if artist is None:
+        abort(404)
+    return render_template('pages/show_artist.html', artist=artist_page(artist, past, upcoming),
+                           similar=similar)
+
+
+async def shows():
+    from app import format_datetime
+    shows = await adb.scalars(select(Show)
+                              .options(joinedload(Show.venue), joinedload(Show.artist))
+                              .order_by(Show.start_time.desc()))
+    data = [{
+        "id": show.id,
+        "venue_id": show.venue_id,
+        "venue_name": show.venue.name,
+        "artist_id": show.artist_id,
+        "artist_name": show.artist.name,
+        "artist_image_link": show.artist.image_link,
+        "start_time": format_datetime(str(show.start_time))
+    } for show in shows]
+    return render_template('pages/shows.html', shows=data)
+
+
+VIEWS = {
+    'main.search': search,
+    'main.venues': venues,
+    'main.search_venues': search_venues,
+    'main.show_venue': show_venue,
+    'main.artists': artists,
+    'main.search_artists': search_artists,
+    'main.show_artist': show_artist,
+    'main.shows': shows,
+}
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def init_app(app):
+    """Swap the read-only views for their async versions when ASYNC_VIEWS is on.
+
+    Must run after the blueprint is registered, since it replaces the view
+    functions behind the existing endpoints (URLs and url_for are unchanged).
+    """
+    if not app.config.get('ASYNC_VIEWS'):
+        return
+    adb.init_app(app)
+    # the Show.venue / Show.artist backrefs only exist once mappers are configured
+    configure_mappers()
+    app.async_to_sync = runner.async_to_sync
+    for endpoint, view in VIEWS.items():
+        app.view_functions[endpoint] = view
@@ -0,0 +1,132 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import threading
+import time
+from collections import OrderedDict
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+
+# ----------------------------------------------------------------------------#
+# Fragment store.
+# ----------------------------------------------------------------------------#
+
+class FragmentCache(object):
+    """Bounded in-memory LRU store for rendered template fragments.
+
+    Every cached entity (venue, artist, show) carries a version number that is
+    bumped whenever the row changes, and fragment keys embed that version, so
+    an edit only invalidates the fragments built from that entity. Stale
+    entries are never looked up again and simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries=10000, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.default_ttl
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def version(self, kind, entity_id):
+        return self._versions.get((kind, int(entity_id)), 0)
+
+    def bump(self, kind, entity_id):
+        with self._lock:
+            key = (kind, int(entity_id))
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    # called by the invalidation bus once a change is committed, by this
+    # worker or any other; bumping at flush would let a concurrent request
+    # cache the old committed row under the new version
+    invalidate = bump
+
+    def key(self, kind, entity_id, **depends_on):
+        # e.g. fragment_key('show', show.id, artist=show.artist_id, venue=show.venue_id)
+        parts = [f'{kind}:{entity_id}:v{self.version(kind, entity_id)}']
+        for dep_kind, dep_id in sorted(depends_on.items()):
+            if dep_id is not None:
+                parts.append(f'{dep_kind}:{dep_id}:v{self.version(dep_kind, dep_id)}')
+        return '|'.join(parts)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ----------------------------------------------------------------------------#
+# Jinja extension.
+# ----------------------------------------------------------------------------#
+
+class FragmentCacheExtension(Extension):
+    """Adds a ``{% cache key, ttl %}...{% endcache %}`` block to templates.
+
+    ``ttl`` is optional and falls back to the store's default. When no store
+    is attached to the environment the block renders uncached.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, key, ttl, caller):
+        store = self.environment.fragment_cache
+        if store is None:
+            return caller()
+        rv = store.get(key)
+        if rv is None:
+            rv = caller()
+            store.set(key, rv, ttl)
+        return rv
+
+
+def init_app(app):
+    store = FragmentCache(
+        max_entries=app.config.get('FRAGMENT_CACHE_MAX_ENTRIES', 10000),
+        default_ttl=app.config.get('FRAGMENT_CACHE_TTL', 300),
+    )
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = store
+    app.jinja_env.globals['fragment_key'] = store.key
+    app.extensions['fragment_cache'] = store
+    app.extensions.setdefault('invalidation_stores', []).append(store)
+    return store
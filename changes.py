@@ -0,0 +1,93 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, exists, func, select, text
+from sqlalchemy.orm import aliased
+
+from models import db, EntityChange
+
+# Triggers append a row to entity_change for every venue or artist a
+# statement changes, itself or through its shows (migration 5d1a8c6e2f43).
+# Each row holds its transaction id, so a reader that kept the pg_snapshot of
+# an earlier read finds exactly the changes committed after that read, in
+# whatever order the writers commit.
+
+
+def current_snapshot(connection):
+    """The database's current pg_snapshot, as text to be kept until the next run."""
+    return connection.execute(text('SELECT CAST(pg_current_snapshot() AS text)')).scalar()
+
+
+def committed_after(snapshot):
+    """Condition on entity_change: written by a transaction that had not
+    committed when ``snapshot`` was taken."""
+    return text(
+        'entity_change.xid >= CAST(CAST(pg_snapshot_xmin(CAST(:snapshot AS pg_snapshot)) AS text) AS bigint) '
+        'AND NOT pg_visible_in_snapshot(CAST(CAST(entity_change.xid AS text) AS xid8), '
+        'CAST(:snapshot AS pg_snapshot))'
+    ).bindparams(snapshot=snapshot)
+
+
+def changed_ids(connection, kind, snapshot, batch_size=1000):
+    """Ids of the ``kind`` entities changed since ``snapshot``, deleted ones
+    included, a batch at a time in id order."""
+    after = 0
+    while True:
+        ids = connection.execute(
+            select(EntityChange.entity_id).distinct()
+            .where(EntityChange.kind == kind, EntityChange.entity_id > after, committed_after(snapshot))
+            .order_by(EntityChange.entity_id).limit(batch_size)).scalars().all()
+        if not ids:
+            return
+        yield ids
+        after = ids[-1]
+
+
+def changed_since(connection, snapshot):
+    """Whether any venue or artist has changed since ``snapshot``."""
+    return connection.execute(select(select(EntityChange.id).where(committed_after(snapshot)).exists())).scalar()
+
+
+def last_changed(kind, entity_id):
+    """When the entity was last changed, as a correlated subquery; NULL for
+    one unchanged since the log was created."""
+    return (select(func.max(EntityChange.changed_at))
+            .where(EntityChange.kind == kind, EntityChange.entity_id == entity_id)
+            .scalar_subquery())
+
+
+def compact(connection, keep_days):
+    """Delete the rows older than ``keep_days`` that a later change of the
+    same entity supersedes, keeping its last modification time."""
+    later = aliased(EntityChange)
+    return connection.execute(
+        delete(EntityChange)
+        .where(EntityChange.changed_at < func.clock_timestamp() - func.make_interval(0, 0, 0, keep_days),
+               exists().where(later.kind == EntityChange.kind,
+                              later.entity_id == EntityChange.entity_id,
+                              later.changed_at > EntityChange.changed_at))
+    ).rowcount
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+changes_cli = AppGroup('changes', help='Maintain the venue and artist change log.')
+
+
+@changes_cli.command('compact')
+def compact_command():
+    """Drop superseded change log rows; run from cron."""
+    keep_days = current_app.config.get('ENTITY_CHANGE_KEEP_DAYS', 7)
+    with db.engine.begin() as connection:
+        deleted = compact(connection, keep_days)
+    click.echo(f'{deleted} change log rows deleted')
+
+
+def init_app(app):
+    app.cli.add_command(changes_cli)
@@ -0,0 +1,194 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import time
+import zlib
+
+from flask import current_app, request
+from prometheus_client import Counter
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+# ----------------------------------------------------------------------------#
+
+RESPONSES = Counter('fyyur_compressed_responses_total',
+                    'Responses compressed on the fly', ['encoding'])
+BYTES_IN = Counter('fyyur_compression_bytes_in_total',
+                   'Response bytes before compression', ['encoding'])
+BYTES_OUT = Counter('fyyur_compression_bytes_out_total',
+                    'Response bytes after compression', ['encoding'])
+CPU_SECONDS = Counter('fyyur_compression_cpu_seconds_total',
+                      'CPU time spent compressing responses', ['encoding'])
+
+
+# ----------------------------------------------------------------------------#
+# Encoders.
+# ----------------------------------------------------------------------------#
+
+class GzipEncoder(object):
+    def __init__(self, level):
+        # wbits=31 produces a gzip header and trailer
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(object):
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class ZstdEncoder(object):
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush()
+
+
+ENCODERS = {'gzip': GzipEncoder}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS['zstd'] = ZstdEncoder
+
+
+# ----------------------------------------------------------------------------#
+# Response hook.
+# ----------------------------------------------------------------------------#
+
+def _choose_encoding(config):
+    available = [name for name in config['COMPRESS_ALGORITHMS'] if name in ENCODERS]
+    # ties in client quality are broken by our own preference order
+    return request.accept_encodings.best_match(available)
+
+
+def _should_compress(response, config):
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in config['COMPRESS_MIMETYPES']:
+        return False
+    if 'no-transform' in response.headers.get('Cache-Control', ''):
+        return False
+    if not response.is_streamed:
+        return response.content_length is not None and \
+            response.content_length >= config['COMPRESS_MIN_SIZE']
+    return True
+
+
+def _compress_buffered(response, encoder, encoding):
+    data = response.get_data()
+    start = time.thread_time()
+    compressed = encoder.compress(data) + encoder.finish()
+    CPU_SECONDS.labels(encoding).inc(time.thread_time() - start)
+    BYTES_IN.labels(encoding).inc(len(data))
+    BYTES_OUT.labels(encoding).inc(len(compressed))
+    response.set_data(compressed)
+
+
+def _compress_stream(chunks, encoder, encoding, flush_bytes, flush_seconds):
+    # output is flushed once flush_bytes of input or flush_seconds have gone
+    # by since the last flush, so streamed pages still arrive incrementally
+    # without paying a flush (and its bytes) for every small chunk
+    pending, flushed = 0, time.monotonic()
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            start = time.thread_time()
+            compressed = encoder.compress(chunk)
+            pending += len(chunk)
+            now = time.monotonic()
+            if pending >= flush_bytes or now - flushed >= flush_seconds:
+                compressed += encoder.flush()
+                pending, flushed = 0, now
+            CPU_SECONDS.labels(encoding).inc(time.thread_time() - start)
+            BYTES_IN.labels(encoding).inc(len(chunk))
+            if compressed:
+                BYTES_OUT.labels(encoding).inc(len(compressed))
+                yield compressed
+        tail = encoder.finish()
+        BYTES_OUT.labels(encoding).inc(len(tail))
+        yield tail
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    config = current_app.config
+    if not _should_compress(response, config):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(config)
+    if encoding is None:
+        return response
+    encoder = ENCODERS[encoding](config['COMPRESS_LEVEL'][encoding])
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoder, encoding,
+                                             config['COMPRESS_STREAM_FLUSH_BYTES'],
+                                             config['COMPRESS_STREAM_FLUSH_SECONDS'])
+        response.headers.pop('Content-Length', None)
+    else:
+        _compress_buffered(response, encoder, encoding)
+    response.headers['Content-Encoding'] = encoding
+    if response.get_etag()[0]:
+        etag, weak = response.get_etag()
+        response.set_etag(f'{etag}-{encoding}', weak)
+    RESPONSES.labels(encoding).inc()
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ALGORITHMS', ['zstd', 'br', 'gzip'])
+    app.config.setdefault('COMPRESS_LEVEL', {'gzip': 6, 'br': 4, 'zstd': 3})
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_STREAM_FLUSH_BYTES', 16384)
+    app.config.setdefault('COMPRESS_STREAM_FLUSH_SECONDS', 0.1)
+    app.config.setdefault('COMPRESS_MIMETYPES', [
+        'text/html', 'text/css', 'text/plain', 'text/xml',
+        'application/json', 'application/javascript', 'application/xml',
+    ])
+    app.after_request(compress_response)
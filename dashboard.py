@@ -0,0 +1,202 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import logging
+import os
+import threading
+import time
+
+import click
+from flask import jsonify
+from flask.cli import AppGroup
+from prometheus_client import Gauge, Histogram
+from sqlalchemy import text
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# created by migration 0b7d3e5f9c21, each with the unique index that
+# REFRESH ... CONCURRENTLY requires
+VIEWS = ('dashboard_upcoming_shows', 'dashboard_busy_venues', 'dashboard_top_genres')
+
+# any fixed key shared by all workers and the refresh command
+REFRESH_LOCK = 727172
+
+REFRESH_SECONDS = Histogram('fyyur_dashboard_refresh_seconds',
+                            'Time spent refreshing the dashboard views')
+LAST_REFRESH = Gauge('fyyur_dashboard_last_refresh_timestamp_seconds',
+                     'When this process last refreshed the dashboard views',
+                     multiprocess_mode='max')
+
+
+# ----------------------------------------------------------------------------#
+# Refresh.
+# ----------------------------------------------------------------------------#
+
+def refresh(engine):
+    """Refresh the dashboard views unless another process is already at it.
+
+    CONCURRENTLY keeps the views readable while they are rebuilt. Returns
+    the refresh time in milliseconds, or None when the lock was taken.
+    """
+    with engine.connect() as connection:
+        if not connection.execute(text('SELECT pg_try_advisory_lock(:key)'), {'key': REFRESH_LOCK}).scalar():
+            return None
+        try:
+            started = time.perf_counter()
+            with connection.begin():
+                for view in VIEWS:
+                    connection.execute(text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view}'))
+                duration_ms = (time.perf_counter() - started) * 1000
+                connection.execute(text(
+                    "UPDATE dashboard_state SET refreshed_at = LOCALTIMESTAMP, duration_ms = :duration "
+                    "WHERE name = 'dashboard'"), {'duration': duration_ms})
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': REFRESH_LOCK})
+    REFRESH_SECONDS.observe(duration_ms / 1000)
+    LAST_REFRESH.set_to_current_time()
+    return duration_ms
+
+
+def staleness(connection):
+    """Seconds since the last refresh (a float, not extract's numeric), and
+    how long that refresh took."""
+    return connection.execute(text(
+        "SELECT extract(epoch FROM LOCALTIMESTAMP - refreshed_at)::float8, duration_ms, refreshed_at "
+        "FROM dashboard_state WHERE name = 'dashboard'")).one()
+
+
+class DashboardRefresher(object):
+    """Refreshes the dashboard views on a schedule and after enough writes.
+
+    Registered as a store on the invalidation bus, so every worker counts
+    the venue, artist and show changes committed by all of them. A thread
+    per worker wakes up every DASHBOARD_REFRESH_INTERVAL, or as soon as
+    DASHBOARD_REFRESH_WRITES changes have been seen, and refreshes once the
+    views are older than the interval or DASHBOARD_MIN_REFRESH_INTERVAL
+    respectively. The advisory lock and the shared refresh time keep the
+    workers from refreshing more than once between them.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.writes = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('DASHBOARD_REFRESH_INTERVAL', 300)
+        self.min_interval = app.config.get('DASHBOARD_MIN_REFRESH_INTERVAL', 30)
+        self.write_threshold = app.config.get('DASHBOARD_REFRESH_WRITES', 50)
+        app.extensions.setdefault('invalidation_stores', []).append(self)
+        if app.config.get('DASHBOARD_AUTO_REFRESH', True):
+            app.before_request(self.ensure_running)
+
+    def invalidate(self, kind, entity_id):
+        self.writes += 1
+        if self.write_threshold and self.writes >= self.write_threshold:
+            self._wake.set()
+
+    def ensure_running(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self.writes = 0
+                threading.Thread(target=self._run, name='dashboard-refresh', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            woken = self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    with db.engine.connect() as connection:
+                        age = staleness(connection)[0]
+                    if age >= (self.min_interval if woken else self.interval):
+                        if refresh(db.engine) is not None:
+                            self.writes = 0
+                    elif woken:
+                        # too soon after the last refresh: try again later
+                        time.sleep(self.min_interval - age)
+                        self._wake.set()
+            except Exception:
+                # whatever goes wrong, the thread lives on for the next round
+                logger.exception('Dashboard refresh failed')
+
+
+refresher = DashboardRefresher()
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+UPCOMING_SHOWS = text("""
+    SELECT show_id, start_time, venue_id, venue_name, city, state,
+           artist_id, artist_name, artist_image_link
+    FROM dashboard_upcoming_shows
+    WHERE start_time >= LOCALTIMESTAMP AND start_time < LOCALTIMESTAMP + interval '7 days'
+    ORDER BY start_time
+    LIMIT :limit
+""")
+BUSY_VENUES = text("""
+    SELECT venue_id, name, city, state, image_link, upcoming_shows
+    FROM dashboard_busy_venues ORDER BY upcoming_shows DESC, name LIMIT :limit
+""")
+TOP_GENRES = text("""
+    SELECT genre, upcoming_shows, artists
+    FROM dashboard_top_genres ORDER BY upcoming_shows DESC, genre LIMIT :limit
+""")
+
+
+def dashboard(connection, limit=6):
+    age, duration_ms, refreshed_at = staleness(connection)
+    return {
+        'upcoming_shows': connection.execute(UPCOMING_SHOWS, {'limit': limit * 2}).all(),
+        'busy_venues': connection.execute(BUSY_VENUES, {'limit': limit}).all(),
+        'top_genres': connection.execute(TOP_GENRES, {'limit': limit * 2}).all(),
+        'refreshed_at': refreshed_at,
+        'refresh_ms': duration_ms,
+        'staleness': age,
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+def dashboard_status():
+    with db.engine.connect() as connection:
+        age, duration_ms, refreshed_at = staleness(connection)
+    return jsonify({
+        'refreshed_at': refreshed_at.isoformat(),
+        'staleness_seconds': float(age),
+        'refresh_ms': duration_ms,
+        'writes_since_refresh': refresher.writes,
+    })
+
+
+dashboard_cli = AppGroup('dashboard', help='Maintain the home page dashboard.')
+
+
+@dashboard_cli.command('refresh')
+def refresh_command():
+    """Refresh the dashboard views now; for cron when the workers' own
+    schedule is turned off (DASHBOARD_AUTO_REFRESH)."""
+    duration_ms = refresh(db.engine)
+    if duration_ms is None:
+        click.echo('a refresh is already running')
+    else:
+        click.echo(f'refreshed in {duration_ms:.0f} ms')
+
+
+def init_app(app):
+    refresher.init_app(app)
+    app.add_url_rule('/dashboard/status', 'dashboard_status', dashboard_status)
+    app.cli.add_command(dashboard_cli)
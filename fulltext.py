@@ -0,0 +1,124 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import math
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import func, literal_column, select, union_all
+
+from models import Venue, Artist
+
+# search_vector is a generated, GIN-indexed tsvector on venue and artist,
+# built from models.SEARCH_DOCUMENT
+MODELS = {'venue': Venue, 'artist': Artist}
+
+# inlined rather than bound, so asyncpg does not have to infer a regconfig
+ENGLISH = literal_column("'english'::regconfig")
+
+# private-use characters that cannot clash with user text; swapped for
+# <mark> once the highlighted text has been escaped
+START_SEL, STOP_SEL = '\ue000', '\ue001'
+HEADLINE_OPTIONS = f'StartSel={START_SEL}, StopSel={STOP_SEL}, MaxWords=30, MinWords=12, MaxFragments=2'
+NAME_HEADLINE_OPTIONS = f'StartSel={START_SEL}, StopSel={STOP_SEL}, HighlightAll=true'
+
+
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+def tsquery(term):
+    """AND of the words in ``term``, the last one as a prefix so results
+    show up while the user is still typing. Returns None for no words."""
+    words = re.findall(r'\w+', term)
+    if not words:
+        return None
+    words[-1] += ':*'
+    return func.to_tsquery(ENGLISH, ' & '.join(words))
+
+
+def _matches(kind, query):
+    model = MODELS[kind]
+    columns = [
+        literal_column(f"'{kind}'").label('kind'),
+        model.id, model.name, model.city, model.state, model.genres,
+        model.seeking_description.label('description'),
+    ]
+    if query is None:
+        return select(*columns, literal_column('0.0').label('rank'))
+    return (select(*columns, func.ts_rank(model.search_vector, query).label('rank'))
+            .where(model.search_vector.op('@@')(query)))
+
+
+def statements(term, kinds, page=1, per_page=20):
+    """Build the (rows, count) statements for one page of search results.
+
+    Matches are ranked with ts_rank across all ``kinds``; ts_headline, which
+    has to re-parse the documents, only runs on the rows of the page. An
+    empty term lists everything by name.
+    """
+    query = tsquery(term)
+    matches = union_all(*[_matches(kind, query) for kind in kinds]).subquery('matches')
+    page_rows = (select(matches)
+                 .order_by(matches.c.rank.desc(), matches.c.name, matches.c.id)
+                 .limit(per_page).offset((page - 1) * per_page)
+                 .subquery('page'))
+    if query is None:
+        name, description = page_rows.c.name, page_rows.c.description
+    else:
+        name = func.ts_headline(ENGLISH, page_rows.c.name, query, NAME_HEADLINE_OPTIONS)
+        description = func.ts_headline(ENGLISH, func.coalesce(page_rows.c.description, ''),
+                                       query, HEADLINE_OPTIONS)
+    rows = (select(page_rows.c.kind, page_rows.c.id, page_rows.c.city, page_rows.c.state,
+                   page_rows.c.genres, page_rows.c.rank,
+                   name.label('name'), description.label('description'))
+            .order_by(page_rows.c.rank.desc(), page_rows.c.name, page_rows.c.id))
+    count = select(func.count()).select_from(matches)
+    return rows, count
+
+
+# ----------------------------------------------------------------------------#
+# Results.
+# ----------------------------------------------------------------------------#
+
+def highlight(text):
+    if not text:
+        return Markup('')
+    return Markup(str(escape(text)).replace(START_SEL, '<mark>').replace(STOP_SEL, '</mark>'))
+
+
+def results(rows, total, page, per_page):
+    return {
+        "count": total,
+        "page": page,
+        "pages": max(1, math.ceil(total / per_page)),
+        "data": [{
+            "kind": row.kind,
+            "id": row.id,
+            "name": highlight(row.name),
+            "city": row.city,
+            "state": row.state,
+            "genres": row.genres or [],
+            "description": highlight(row.description),
+            "rank": row.rank,
+        } for row in rows],
+    }
+
+
+def search(session, term, kinds, page=1, per_page=20):
+    rows, count = statements(term, kinds, page, per_page)
+    return results(session.execute(rows), session.execute(count).scalar(), page, per_page)
+
+
+def parse_args(args, config):
+    """Search parameters from the query string: q, type (venue/artist) and page."""
+    kinds = [args['type']] if args.get('type') in MODELS else list(MODELS)
+    per_page = min(args.get('per_page', config.get('SEARCH_PER_PAGE', 20), type=int),
+                   config.get('SEARCH_MAX_PER_PAGE', 100))
+    return {
+        'term': args.get('q', '').strip(),
+        'kinds': kinds,
+        'page': max(args.get('page', 1, type=int), 1),
+        'per_page': max(per_page, 1),
+    }
@@ -0,0 +1,48 @@
+# ----------------------------------------------------------------------------#
+# gunicorn settings: gunicorn -c gunicorn.conf.py
+# Every value can be overridden from the environment.
+# ----------------------------------------------------------------------------#
+
+import multiprocessing
+import os
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# one process per core plus spares for requests blocked on the database
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# with FYYUR_ASYNC_VIEWS=1 threads mostly wait on the shared event loop, so
+# many more of them are affordable
+threads = int(os.environ.get('GUNICORN_THREADS',
+                             32 if os.environ.get('FYYUR_ASYNC_VIEWS') == '1' else 4))
+
+# import the app and compile templates once in the master; workers fork from it
+preload_app = True
+
+# recycle workers to cap memory growth, staggered so they don't restart together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 200))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+
+raw_env = ['FYYUR_ENV=' + os.environ.get('FYYUR_ENV', 'production')]
+
+
+def post_fork(server, worker):
+    # connections opened in the master must not be shared by the workers
+    from models import db
+    from wsgi import application
+    with application.app_context():
+        db.engine.dispose()
+
+
+def child_exit(server, worker):
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,25 @@
+# ----------------------------------------------------------------------------#
+# gunicorn settings for the live show streams: gunicorn -c gunicorn.live.conf.py
+# Run next to the main pool, with the proxy sending /shows/stream here (see
+# README). Every open stream waits on its own thread, so this pool has few
+# processes with many threads, and serves nothing slow that could hold them.
+# ----------------------------------------------------------------------------#
+
+import os
+import runpy
+
+# everything else (app, hooks, logging) as in the main pool
+globals().update({name: value for name, value in
+                  runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')).items()
+                  if not name.startswith('__')})
+
+bind = os.environ.get('LIVE_BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('LIVE_WORKERS', 2))
+threads = int(os.environ.get('LIVE_THREADS', 1000))
+
+# streams end by themselves after LIVE_MAX_STREAM_SECONDS; recycling the
+# workers would only cut them all at once
+max_requests = 0
+
+# all but a few threads may hold a stream; the rest answer the 503s
+raw_env = raw_env + ['LIVE_MAX_SUBSCRIBERS=' + os.environ.get('LIVE_MAX_SUBSCRIBERS', str(max(1, threads - 20)))]
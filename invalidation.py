@@ -0,0 +1,200 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import glob
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from live import listener
+from models import Venue, Artist, Show
+
+logger = logging.getLogger(__name__)
+
+ENTITY_KINDS = {Venue: 'venue', Artist: 'artist', Show: 'show'}
+
+# pg_notify payloads are limited to 8000 bytes
+MAX_KEYS_PER_MESSAGE = 200
+
+
+# ----------------------------------------------------------------------------#
+# Transports.
+# ----------------------------------------------------------------------------#
+
+class PostgresTransport(object):
+    """NOTIFY inside the committing transaction, so only committed changes go out."""
+    transactional = True
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def start(self, receive):
+        listener.on(self.channel, receive)
+
+    def ensure_listening(self):
+        listener.start()
+
+    def publish(self, session, payload):
+        session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                        {'channel': self.channel, 'payload': json.dumps(payload)})
+
+
+class SocketTransport(object):
+    """Broadcasts over Unix datagram sockets, one per process, in a shared directory.
+
+    Needs no database, which makes it suitable for tests and single-host
+    setups; published after commit since it is not transactional.
+    """
+    transactional = False
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._receive = None
+        self._sock = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, receive):
+        self._receive = receive
+
+    def ensure_listening(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.unlink(path)
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(path)
+            threading.Thread(target=self._run, name='invalidation-socket', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        sock = self._sock
+        while True:
+            data = sock.recv(65536)
+            try:
+                self._receive(json.loads(data))
+            except Exception:
+                logger.exception('Error handling invalidation message')
+
+    def publish(self, session, payload):
+        data = json.dumps(payload).encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            for path in glob.glob(os.path.join(self.directory, '*.sock')):
+                try:
+                    sock.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # the process behind it is gone
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+
+# ----------------------------------------------------------------------------#
+# Bus.
+# ----------------------------------------------------------------------------#
+
+class InvalidationBus(object):
+    """Evicts entries of every in-process store when an entity changes anywhere.
+
+    Changes to Venue, Artist and Show rows are collected per session at flush
+    time and published as ``[kind, id]`` keys when the session commits. Every
+    worker, including the publishing one, calls ``invalidate(kind, id)`` on
+    each registered store.
+    """
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self.stores = []
+        self.transport = None
+
+    def init_app(self, app):
+        if app.config.get('INVALIDATION_BACKEND', 'postgres') == 'socket':
+            self.transport = SocketTransport(app.config['INVALIDATION_SOCKET_DIR'])
+        else:
+            self.transport = PostgresTransport(app.config.get('INVALIDATION_CHANNEL', 'fyyur_invalidate'))
+        self.transport.start(self.receive)
+        app.before_request(self.transport.ensure_listening)
+        # the stores of the latest app, not of every app built in this process
+        self.stores = []
+        for store in app.extensions.get('invalidation_stores', []):
+            self.register(store)
+        app.extensions['invalidation_bus'] = self
+
+    def register(self, store):
+        if store not in self.stores:
+            self.stores.append(store)
+
+    def invalidate(self, keys):
+        for kind, entity_id in keys:
+            for store in self.stores:
+                store.invalidate(kind, entity_id)
+
+    def receive(self, payload):
+        # our own changes were already applied at commit time
+        if payload.get('origin') != self.origin:
+            self.invalidate(payload.get('keys', []))
+
+    def publish(self, session, keys):
+        keys = sorted(keys)
+        for start in range(0, len(keys), MAX_KEYS_PER_MESSAGE):
+            payload = {'origin': self.origin, 'keys': keys[start:start + MAX_KEYS_PER_MESSAGE]}
+            self.transport.publish(session, payload)
+
+
+bus = InvalidationBus()
+
+
+def mark(session, kind, ids):
+    """Queue keys for changes the ORM does not see, such as Core DELETEs."""
+    session.info.setdefault('invalidate', set()).update((kind, int(i)) for i in ids)
+
+
+# ----------------------------------------------------------------------------#
+# Session events.
+# ----------------------------------------------------------------------------#
+
+@event.listens_for(Session, 'after_flush')
+def _collect(session, flush_context):
+    keys = session.info.setdefault('invalidate', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        kind = ENTITY_KINDS.get(type(obj))
+        if kind is not None and obj.id is not None:
+            keys.add((kind, obj.id))
+
+
+@event.listens_for(Session, 'before_commit')
+def _publish_in_transaction(session):
+    if bus.transport is None or not bus.transport.transactional:
+        return
+    session.flush()
+    keys = session.info.get('invalidate')
+    if keys:
+        bus.publish(session, keys)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply(session):
+    keys = session.info.pop('invalidate', None)
+    if not keys or bus.transport is None:
+        return
+    bus.invalidate(keys)
+    if not bus.transport.transactional:
+        bus.publish(session, keys)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    session.info.pop('invalidate', None)
@@ -0,0 +1,262 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+from flask import Response, abort, current_app, request
+from sqlalchemy import func, select
+
+from models import db, Venue, Artist, Show
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------------#
+# LISTEN connection.
+# ----------------------------------------------------------------------------#
+
+class PgListener(object):
+    """A single LISTEN connection per worker process, shared by all channels.
+
+    Callbacks registered with ``on(channel, callback)`` are called on the
+    listener thread with the decoded notification payload; registering
+    again under the same ``name`` replaces the earlier callback. The thread is
+    started lazily after fork, and reconnects (re-issuing LISTEN) when the
+    connection drops.
+    """
+
+    def __init__(self):
+        self.dsn = None
+        self._callbacks = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.dsn = app.config.get('LISTEN_DATABASE_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+
+    def on(self, channel, callback, name=None):
+        with self._lock:
+            self._callbacks.setdefault(channel, {})[name or callback] = callback
+
+    def start(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                threading.Thread(target=self._run, name='pg-listener', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        delay = 1
+        try:
+            while True:
+                try:
+                    self._listen()
+                except Exception:
+                    # not only psycopg2 errors: anything ending _listen would
+                    # otherwise leave the worker without notifications
+                    logger.exception('LISTEN connection lost, reconnecting in %ss', delay)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 30)
+                else:
+                    delay = 1
+        finally:
+            # lets the next start() replace this thread
+            with self._lock:
+                if self._pid == os.getpid():
+                    self._pid = None
+
+    def _listen(self):
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                for channel in list(self._callbacks):
+                    cursor.execute(f'LISTEN "{channel}"')
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0))
+        finally:
+            conn.close()
+
+    def _dispatch(self, notify):
+        try:
+            payload = json.loads(notify.payload)
+        except ValueError:
+            payload = notify.payload
+        for callback in list(self._callbacks.get(notify.channel, {}).values()):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception('Error handling notification on %s', notify.channel)
+
+
+listener = PgListener()
+
+
+# ----------------------------------------------------------------------------#
+# Show feed.
+# ----------------------------------------------------------------------------#
+
+class ShowFeed(object):
+    """Fans show notifications out to the SSE subscribers of this worker."""
+
+    def __init__(self, max_subscribers=1, queue_size=100):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, filters):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            events = queue.Queue(self.queue_size)
+            self._subscribers[events] = filters
+            return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            self._subscribers.pop(events, None)
+
+    def publish(self, show):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for events, filters in subscribers:
+            if not _matches(show, filters):
+                continue
+            try:
+                events.put_nowait(show)
+            except queue.Full:
+                # a slow client misses events rather than holding memory
+                pass
+
+
+def _matches(show, filters):
+    if filters.get('city') and (show.get('city') or '').lower() != filters['city']:
+        return False
+    if filters.get('venue_id') and show.get('venue_id') != filters['venue_id']:
+        return False
+    if filters.get('artist_id') and show.get('artist_id') != filters['artist_id']:
+        return False
+    return True
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+def _sse(show):
+    return f"event: show\nid: {show['id']}\ndata: {json.dumps(show)}\n\n"
+
+
+def _last_event_id():
+    try:
+        return int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        return None
+
+
+def missed_shows(after, filters, limit):
+    """Shows added after the show ``after`` that match ``filters``, as the
+    trigger's notification payloads, at most ``limit`` + 1 of them."""
+    query = (select(Show.id, Show.venue_id, Show.artist_id, Show.start_time,
+                    Venue.name, Venue.city, Venue.state, Artist.name, Artist.image_link)
+             .outerjoin(Venue, Venue.id == Show.venue_id)
+             .outerjoin(Artist, Artist.id == Show.artist_id)
+             .where(Show.id > after).order_by(Show.id).limit(limit + 1))
+    if filters.get('city'):
+        query = query.where(func.lower(Venue.city) == filters['city'])
+    if filters.get('venue_id'):
+        query = query.where(Show.venue_id == filters['venue_id'])
+    if filters.get('artist_id'):
+        query = query.where(Show.artist_id == filters['artist_id'])
+    return [{
+        'op': 'INSERT', 'id': show_id, 'venue_id': venue_id, 'artist_id': artist_id,
+        'start_time': start_time.isoformat(), 'venue_name': venue_name, 'city': city,
+        'state': state, 'artist_name': artist_name, 'artist_image_link': image_link,
+    } for show_id, venue_id, artist_id, start_time, venue_name, city, state, artist_name, image_link
+        in db.session.execute(query)]
+
+
+def show_stream():
+    # /shows/stream?city=San Francisco&venue_id=1&artist_id=2, all optional
+    feed = current_app.extensions['show_feed']
+    filters = {
+        'city': request.args.get('city', '').strip().lower() or None,
+        'venue_id': request.args.get('venue_id', type=int),
+        'artist_id': request.args.get('artist_id', type=int),
+    }
+    listener.start()
+    events = feed.subscribe(filters)
+    if events is None:
+        abort(503)
+    # a reconnecting browser sends the id of the last show it got: replay the
+    # ones added since, read after subscribing so none falls in between, or
+    # have it reload the page when it has missed too many
+    missed, resync, last_id = [], False, _last_event_id()
+    if last_id is not None:
+        limit = current_app.config.get('LIVE_QUEUE_SIZE', 100)
+        try:
+            missed = missed_shows(last_id, filters, limit)
+        except Exception:
+            feed.unsubscribe(events)
+            raise
+        resync = len(missed) > limit
+        if resync:
+            missed = []
+    replayed = max([show['id'] for show in missed], default=last_id or 0)
+    heartbeat = current_app.config.get('LIVE_HEARTBEAT', 15)
+    # ending streams now and then hands their threads back to the worker
+    deadline = time.monotonic() + current_app.config.get('LIVE_MAX_STREAM_SECONDS', 300)
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            if resync:
+                yield 'event: resync\ndata: {}\n\n'
+            for show in missed:
+                yield _sse(show)
+            while time.monotonic() < deadline:
+                try:
+                    show = events.get(timeout=heartbeat)
+                except queue.Empty:
+                    # keeps proxies from closing an idle stream
+                    yield ': ping\n\n'
+                    continue
+                if show.get('op') == 'INSERT' and show['id'] <= replayed:
+                    continue
+                yield _sse(show)
+        finally:
+            feed.unsubscribe(events)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def init_app(app):
+    feed = ShowFeed(
+        max_subscribers=app.config.get('LIVE_MAX_SUBSCRIBERS', 1),
+        queue_size=app.config.get('LIVE_QUEUE_SIZE', 100),
+    )
+    app.extensions['show_feed'] = feed
+    listener.init_app(app)
+    listener.on(app.config.get('LIVE_CHANNEL', 'show_changes'), feed.publish, name='show_feed')
+    app.add_url_rule('/shows/stream', 'show_stream', show_stream)
@@ -0,0 +1,29 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import os
+
+from flask import Response
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY,
+                               generate_latest)
+from prometheus_client import multiprocess
+
+
+# ----------------------------------------------------------------------------#
+# Metrics endpoint.
+# ----------------------------------------------------------------------------#
+
+def metrics():
+    # under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+    # and the scrape aggregates them; otherwise the process registry is enough
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.add_url_rule('/metrics', 'metrics', metrics)
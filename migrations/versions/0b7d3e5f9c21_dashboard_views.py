@@ -0,0 +1,73 @@
+"""dashboard materialized views
+
+Revision ID: 0b7d3e5f9c21
+Revises: f2c6b8e14a07
+Create Date: 2026-10-19 20:31:17.906552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7d3e5f9c21'
+down_revision = 'f2c6b8e14a07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # shows of the next two weeks; the home page narrows this to the coming
+    # seven days when reading, so the list stays right between refreshes
+    op.execute("""
+    CREATE MATERIALIZED VIEW dashboard_upcoming_shows AS
+    SELECT show.id AS show_id, show.start_time,
+           venue.id AS venue_id, venue.name AS venue_name, venue.city, venue.state,
+           artist.id AS artist_id, artist.name AS artist_name, artist.image_link AS artist_image_link
+    FROM show
+    JOIN venue ON venue.id = show.venue_id
+    JOIN artist ON artist.id = show.artist_id
+    WHERE show.start_time >= LOCALTIMESTAMP - interval '1 day'
+      AND show.start_time < LOCALTIMESTAMP + interval '14 days'
+    """)
+    op.execute('CREATE UNIQUE INDEX ix_dashboard_upcoming_shows_key ON dashboard_upcoming_shows (show_id, start_time)')
+    op.execute('CREATE INDEX ix_dashboard_upcoming_shows_start_time ON dashboard_upcoming_shows (start_time)')
+
+    op.execute("""
+    CREATE MATERIALIZED VIEW dashboard_busy_venues AS
+    SELECT venue.id AS venue_id, venue.name, venue.city, venue.state, venue.image_link,
+           count(*) AS upcoming_shows
+    FROM show
+    JOIN venue ON venue.id = show.venue_id
+    WHERE show.start_time >= LOCALTIMESTAMP AND show.start_time < LOCALTIMESTAMP + interval '30 days'
+    GROUP BY venue.id
+    """)
+    op.execute('CREATE UNIQUE INDEX ix_dashboard_busy_venues_key ON dashboard_busy_venues (venue_id)')
+    op.execute('CREATE INDEX ix_dashboard_busy_venues_upcoming ON dashboard_busy_venues (upcoming_shows DESC)')
+
+    op.execute("""
+    CREATE MATERIALIZED VIEW dashboard_top_genres AS
+    SELECT genre, count(*) AS upcoming_shows, count(DISTINCT show.artist_id) AS artists
+    FROM show
+    JOIN artist ON artist.id = show.artist_id
+    CROSS JOIN LATERAL unnest(artist.genres) AS genre
+    WHERE show.start_time >= LOCALTIMESTAMP AND show.start_time < LOCALTIMESTAMP + interval '30 days'
+    GROUP BY genre
+    """)
+    op.execute('CREATE UNIQUE INDEX ix_dashboard_top_genres_key ON dashboard_top_genres (genre)')
+    op.execute('CREATE INDEX ix_dashboard_top_genres_upcoming ON dashboard_top_genres (upcoming_shows DESC)')
+
+    op.create_table('dashboard_state',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.Column('duration_ms', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO dashboard_state VALUES ('dashboard', LOCALTIMESTAMP, 0)")
+
+
+def downgrade():
+    op.drop_table('dashboard_state')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS dashboard_top_genres')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS dashboard_busy_venues')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS dashboard_upcoming_shows')
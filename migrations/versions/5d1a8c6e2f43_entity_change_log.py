@@ -0,0 +1,94 @@
+"""entity change log
+
+Revision ID: 5d1a8c6e2f43
+Revises: 0b7d3e5f9c21
+Create Date: 2026-10-19 21:02:26.118374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1a8c6e2f43'
+down_revision = '0b7d3e5f9c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # one row per venue or artist changed by a statement, itself or through
+    # its shows (see changes.py); xid is the writing transaction, so readers
+    # holding a pg_snapshot can tell which changes committed after it.
+    # Needs PostgreSQL 13 for the xid8 functions.
+    op.create_table('entity_change',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('xid', sa.BigInteger(), server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False),
+    sa.Column('changed_at', sa.DateTime(timezone=True), server_default=sa.text('clock_timestamp()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_entity_change_entity', 'entity_change', ['kind', 'entity_id', 'changed_at'], unique=False)
+    op.create_index(op.f('ix_entity_change_xid'), 'entity_change', ['xid'], unique=False)
+
+    # statement-level, with transition tables: each statement appends its
+    # distinct ids once, and no venue or artist row is updated or locked
+    op.execute("""
+    CREATE OR REPLACE FUNCTION log_entity_change() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME <> 'show' THEN
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO entity_change (kind, entity_id) SELECT DISTINCT TG_TABLE_NAME, id FROM old_rows;
+            ELSE
+                INSERT INTO entity_change (kind, entity_id) SELECT DISTINCT TG_TABLE_NAME, id FROM new_rows;
+            END IF;
+        ELSIF TG_OP = 'INSERT' THEN
+            INSERT INTO entity_change (kind, entity_id)
+            SELECT DISTINCT v.kind, v.id FROM new_rows,
+                LATERAL (VALUES ('venue', venue_id), ('artist', artist_id)) AS v (kind, id)
+            WHERE v.id IS NOT NULL;
+        ELSIF TG_OP = 'DELETE' THEN
+            INSERT INTO entity_change (kind, entity_id)
+            SELECT DISTINCT v.kind, v.id FROM old_rows,
+                LATERAL (VALUES ('venue', venue_id), ('artist', artist_id)) AS v (kind, id)
+            WHERE v.id IS NOT NULL;
+        ELSE
+            INSERT INTO entity_change (kind, entity_id)
+            SELECT DISTINCT v.kind, v.id
+            FROM (SELECT venue_id, artist_id FROM old_rows
+                  UNION ALL SELECT venue_id, artist_id FROM new_rows) AS s,
+                LATERAL (VALUES ('venue', venue_id), ('artist', artist_id)) AS v (kind, id)
+            WHERE v.id IS NOT NULL;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    # transition tables allow one event per trigger
+    for table in ('venue', 'artist', 'show'):
+        op.execute(f"""
+        CREATE TRIGGER {table}_change_insert
+        AFTER INSERT ON {table} REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE log_entity_change();
+        """)
+        op.execute(f"""
+        CREATE TRIGGER {table}_change_update
+        AFTER UPDATE ON {table} REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE log_entity_change();
+        """)
+        op.execute(f"""
+        CREATE TRIGGER {table}_change_delete
+        AFTER DELETE ON {table} REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE PROCEDURE log_entity_change();
+        """)
+
+
+def downgrade():
+    for table in ('venue', 'artist', 'show'):
+        for event in ('insert', 'update', 'delete'):
+            op.execute(f'DROP TRIGGER IF EXISTS {table}_change_{event} ON {table}')
+    op.execute('DROP FUNCTION IF EXISTS log_entity_change()')
+    op.drop_index(op.f('ix_entity_change_xid'), table_name='entity_change')
+    op.drop_index('ix_entity_change_entity', table_name='entity_change')
+    op.drop_table('entity_change')
@@ -0,0 +1,53 @@
+"""show change notifications
+
+Revision ID: a4d7f0c2e915
+Revises: 3b9e2c71d4a8
+Create Date: 2026-10-19 14:03:27.114502
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7f0c2e915'
+down_revision = '3b9e2c71d4a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NOTIFY is only delivered when the transaction commits, so listeners
+    # never see a show that was rolled back
+    op.execute("""
+    CREATE OR REPLACE FUNCTION notify_show_change() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('show_changes', json_build_object(
+            'op', TG_OP,
+            'id', NEW.id,
+            'venue_id', NEW.venue_id,
+            'artist_id', NEW.artist_id,
+            'start_time', NEW.start_time,
+            'venue_name', v.name,
+            'city', v.city,
+            'state', v.state,
+            'artist_name', a.name,
+            'artist_image_link', a.image_link
+        )::text)
+        FROM (SELECT 1) AS one
+        LEFT JOIN venue v ON v.id = NEW.venue_id
+        LEFT JOIN artist a ON a.id = NEW.artist_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    op.execute("""
+    CREATE TRIGGER show_notify
+    AFTER INSERT OR UPDATE ON show
+    FOR EACH ROW EXECUTE PROCEDURE notify_show_change();
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS show_notify ON show')
+    op.execute('DROP FUNCTION IF EXISTS notify_show_change()')
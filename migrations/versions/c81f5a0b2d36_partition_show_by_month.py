@@ -0,0 +1,108 @@
+"""partition show by month
+
+Revision ID: c81f5a0b2d36
+Revises: a4d7f0c2e915
+Create Date: 2026-10-19 16:40:52.730118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f5a0b2d36'
+down_revision = 'a4d7f0c2e915'
+branch_labels = None
+depends_on = None
+
+# partitions created ahead of the current month; `flask shows partitions`
+# keeps extending this window afterwards
+MONTHS_AHEAD = 12
+
+
+def upgrade():
+    # move the existing table aside, freeing its schema-wide index names
+    op.execute('DROP TRIGGER IF EXISTS show_notify ON show')
+    op.execute('ALTER TABLE show RENAME TO show_unpartitioned')
+    op.execute('ALTER TABLE show_unpartitioned RENAME CONSTRAINT show_pkey TO show_unpartitioned_pkey')
+    op.drop_index('ix_show_venue_id', table_name='show_unpartitioned')
+    op.drop_index('ix_show_artist_id', table_name='show_unpartitioned')
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+
+    # the partition key has to be part of the primary key
+    op.execute("""
+    CREATE TABLE show (
+        id integer NOT NULL DEFAULT nextval('show_id_seq'),
+        venue_id integer REFERENCES venue (id) ON DELETE CASCADE,
+        artist_id integer REFERENCES artist (id) ON DELETE CASCADE,
+        start_time timestamp without time zone NOT NULL,
+        CONSTRAINT show_pkey PRIMARY KEY (id, start_time)
+    ) PARTITION BY RANGE (start_time)
+    """)
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.create_index(op.f('ix_show_venue_id'), 'show', ['venue_id'], unique=False)
+    op.create_index(op.f('ix_show_artist_id'), 'show', ['artist_id'], unique=False)
+
+    # one partition per month from the oldest show up to MONTHS_AHEAD, plus a
+    # default partition so that inserts outside that window never fail
+    op.execute(f"""
+    DO $$
+    DECLARE
+        first_month date := date_trunc('month', LEAST(
+            (SELECT min(start_time) FROM show_unpartitioned), now()));
+        last_month date := date_trunc('month', now()) + interval '{MONTHS_AHEAD} months';
+    BEGIN
+        WHILE first_month <= last_month LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF show FOR VALUES FROM (%L) TO (%L)',
+                'show_p' || to_char(first_month, 'YYYY_MM'),
+                first_month, first_month + interval '1 month');
+            first_month := first_month + interval '1 month';
+        END LOOP;
+    END
+    $$
+    """)
+    op.execute('CREATE TABLE show_default PARTITION OF show DEFAULT')
+
+    op.execute("""
+    INSERT INTO show (id, venue_id, artist_id, start_time)
+    SELECT id, venue_id, artist_id, start_time FROM show_unpartitioned
+    """)
+    op.execute('DROP TABLE show_unpartitioned')
+
+    op.execute("""
+    CREATE TRIGGER show_notify
+    AFTER INSERT OR UPDATE ON show
+    FOR EACH ROW EXECUTE PROCEDURE notify_show_change();
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS show_notify ON show')
+    op.execute('ALTER TABLE show RENAME TO show_partitioned')
+    op.execute('ALTER TABLE show_partitioned RENAME CONSTRAINT show_pkey TO show_partitioned_pkey')
+    op.drop_index('ix_show_venue_id', table_name='show_partitioned')
+    op.drop_index('ix_show_artist_id', table_name='show_partitioned')
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY NONE')
+    op.create_table('show',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('show_id_seq')"), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=True),
+    sa.Column('artist_id', sa.Integer(), nullable=True),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('ALTER SEQUENCE show_id_seq OWNED BY show.id')
+    op.create_index(op.f('ix_show_venue_id'), 'show', ['venue_id'], unique=False)
+    op.create_index(op.f('ix_show_artist_id'), 'show', ['artist_id'], unique=False)
+    op.execute("""
+    INSERT INTO show (id, venue_id, artist_id, start_time)
+    SELECT id, venue_id, artist_id, start_time FROM show_partitioned
+    """)
+    op.execute('DROP TABLE show_partitioned')
+    op.execute("""
+    CREATE TRIGGER show_notify
+    AFTER INSERT OR UPDATE ON show
+    FOR EACH ROW EXECUTE PROCEDURE notify_show_change();
+    """)
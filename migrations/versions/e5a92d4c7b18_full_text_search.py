@@ -0,0 +1,47 @@
+"""full text search
+
+Revision ID: e5a92d4c7b18
+Revises: c81f5a0b2d36
+Create Date: 2026-10-19 19:48:05.214377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a92d4c7b18'
+down_revision = 'c81f5a0b2d36'
+branch_labels = None
+depends_on = None
+
+# keep in sync with models.SEARCH_DOCUMENT
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', fyyur_array_text(genres::text[])), 'B') || "
+    "setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(seeking_description, '')), 'D')"
+)
+
+
+def upgrade():
+    # array_to_string is only STABLE, which generated columns do not accept;
+    # it is immutable for text arrays, so wrap it
+    op.execute("""
+    CREATE OR REPLACE FUNCTION fyyur_array_text(text[]) RETURNS text
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+    $$ SELECT coalesce(array_to_string($1, ' '), '') $$;
+    """)
+    for table in ('venue', 'artist'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(),
+                                       sa.Computed(SEARCH_DOCUMENT, persisted=True), nullable=True))
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in ('venue', 'artist'):
+        op.drop_index(f'ix_{table}_search_vector', table_name=table)
+        op.drop_column(table, 'search_vector')
+    op.execute('DROP FUNCTION IF EXISTS fyyur_array_text(text[])')
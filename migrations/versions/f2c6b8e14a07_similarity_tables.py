@@ -0,0 +1,106 @@
+"""similarity tables
+
+Revision ID: f2c6b8e14a07
+Revises: e5a92d4c7b18
+Create Date: 2026-10-19 20:05:41.382914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c6b8e14a07'
+down_revision = 'e5a92d4c7b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('similar_venue',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.Column('similar_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_id'], ['venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'rank')
+    )
+    op.create_table('similar_artist',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.SmallInteger(), nullable=False),
+    sa.Column('similar_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['similar_id'], ['artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id', 'rank')
+    )
+    # the cascade on similar_id needs it indexed, and so does the lookup of
+    # the lists a deleted entity appears in
+    op.create_index(op.f('ix_similar_venue_similar_id'), 'similar_venue', ['similar_id'], unique=False)
+    op.create_index(op.f('ix_similar_artist_similar_id'), 'similar_artist', ['similar_id'], unique=False)
+    op.create_table('similarity_queue',
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'entity_id')
+    )
+
+    # queue whatever a change affects: the entity itself when its genres
+    # change, both sides of a booking, and the entities listing a deleted one
+    op.execute("""
+    CREATE OR REPLACE FUNCTION queue_similarity() RETURNS trigger AS $$
+    BEGIN
+        IF TG_TABLE_NAME = 'show' THEN
+            IF TG_OP <> 'INSERT' THEN
+                INSERT INTO similarity_queue
+                SELECT kind, id FROM (VALUES ('venue', OLD.venue_id), ('artist', OLD.artist_id)) AS v (kind, id)
+                WHERE id IS NOT NULL ON CONFLICT DO NOTHING;
+            END IF;
+            IF TG_OP <> 'DELETE' THEN
+                INSERT INTO similarity_queue
+                SELECT kind, id FROM (VALUES ('venue', NEW.venue_id), ('artist', NEW.artist_id)) AS v (kind, id)
+                WHERE id IS NOT NULL ON CONFLICT DO NOTHING;
+            END IF;
+        ELSIF TG_OP = 'DELETE' THEN
+            EXECUTE format(
+                'INSERT INTO similarity_queue SELECT %L, %I FROM %I WHERE similar_id = $1 ON CONFLICT DO NOTHING',
+                TG_TABLE_NAME, TG_TABLE_NAME || '_id', 'similar_' || TG_TABLE_NAME)
+            USING OLD.id;
+            RETURN OLD;
+        ELSE
+            INSERT INTO similarity_queue VALUES (TG_TABLE_NAME, NEW.id) ON CONFLICT DO NOTHING;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    for table in ('venue', 'artist'):
+        op.execute(f"""
+        CREATE TRIGGER {table}_similarity
+        AFTER INSERT OR UPDATE OF genres ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE queue_similarity();
+        """)
+        # before the delete, while the lists still name the entity
+        op.execute(f"""
+        CREATE TRIGGER {table}_similarity_delete
+        BEFORE DELETE ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE queue_similarity();
+        """)
+    op.execute("""
+    CREATE TRIGGER show_similarity
+    AFTER INSERT OR DELETE OR UPDATE OF venue_id, artist_id ON show
+    FOR EACH ROW EXECUTE PROCEDURE queue_similarity();
+    """)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER IF EXISTS show_similarity ON show')
+    for table in ('venue', 'artist'):
+        op.execute(f'DROP TRIGGER IF EXISTS {table}_similarity_delete ON {table}')
+        op.execute(f'DROP TRIGGER IF EXISTS {table}_similarity ON {table}')
+    op.execute('DROP FUNCTION IF EXISTS queue_similarity()')
+    op.drop_table('similarity_queue')
+    op.drop_index(op.f('ix_similar_artist_similar_id'), table_name='similar_artist')
+    op.drop_index(op.f('ix_similar_venue_similar_id'), table_name='similar_venue')
+    op.drop_table('similar_artist')
+    op.drop_table('similar_venue')
@@ -1,11 +1,22 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
-from forms import *
+from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import TSVECTOR
 
 db = SQLAlchemy()
 
+# Weighted full-text document shared by venue and artist (see fulltext.py).
+# fyyur_array_text is an IMMUTABLE array_to_string created by the migration,
+# as generated columns only accept immutable expressions.
+SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', fyyur_array_text(genres::text[])), 'B') || "
+    "setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(seeking_description, '')), 'D')"
+)
+
 
 # ----------------------------------------------------------------------------#
 # Models.
@@ -27,7 +38,12 @@ class Venue(db.Model):
     website_link = db.Column(db.String(500), nullable=True)
     seeking_talent = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(), nullable=True)
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(SEARCH_DOCUMENT, persisted=True)))
+    shows = db.relationship('Show', backref='venue', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_venue_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     def __repr__(self):
         return f'<Venue {self.id}, {self.name}>'
@@ -46,7 +62,12 @@ class Artist(db.Model):
     website_link = db.Column(db.String(500), nullable=True)
     seeking_venue = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(), nullable=True)
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(SEARCH_DOCUMENT, persisted=True)))
+    shows = db.relationship('Show', backref='artist', lazy=True, passive_deletes=True)
+
+    __table_args__ = (
+        db.Index('ix_artist_search_vector', 'search_vector', postgresql_using='gin'),
+    )
 
     def __repr__(self):
         return f'<Artist {self.id}, {self.name}>'
@@ -54,10 +75,63 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'show'
-    id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'))
-    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'))
-    start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    # range partitioned by month (see partitions.py); Postgres requires the
+    # partition key to be part of the primary key
+    __table_args__ = {'postgresql_partition_by': 'RANGE (start_time)'}
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), index=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), index=True)
+    start_time = db.Column(db.DateTime, primary_key=True, nullable=False, default=datetime.utcnow())
 
     def __repr__(self):
         return f'<Venue {self.venue_id}, Artist {self.artist_id}>'
+
+
+# Precomputed top-k neighbours, rebuilt by `flask recommendations refresh`
+# (see recommendations.py) and read in rank order through the primary key
+class SimilarVenue(db.Model):
+    __tablename__ = 'similar_venue'
+    venue_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    similar_id = db.Column(db.Integer, db.ForeignKey('venue.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+class SimilarArtist(db.Model):
+    __tablename__ = 'similar_artist'
+    artist_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.SmallInteger, primary_key=True)
+    similar_id = db.Column(db.Integer, db.ForeignKey('artist.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+
+# Venues and artists whose neighbours need recomputing, queued by triggers
+class SimilarityQueue(db.Model):
+    __tablename__ = 'similarity_queue'
+    kind = db.Column(db.String(10), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+
+
+# Venues and artists changed, themselves or through their shows, one row per
+# statement and entity appended by triggers (see changes.py)
+class EntityChange(db.Model):
+    __tablename__ = 'entity_change'
+    id = db.Column(db.BigInteger, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    # the writing transaction's id, pg_current_xact_id() as a bigint
+    xid = db.Column(db.BigInteger, nullable=False, index=True,
+                    server_default=db.text('pg_current_xact_id()::text::bigint'))
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.text('clock_timestamp()'))
+
+    __table_args__ = (
+        db.Index('ix_entity_change_entity', 'kind', 'entity_id', 'changed_at'),
+    )
+
+
+# When the dashboard materialized views were last refreshed (see dashboard.py)
+class DashboardState(db.Model):
+    __tablename__ = 'dashboard_state'
+    name = db.Column(db.String(50), primary_key=True)
+    refreshed_at = db.Column(db.DateTime, nullable=False)
+    duration_ms = db.Column(db.Float, nullable=False)
@@ -0,0 +1,159 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import gzip
+import os
+import re
+from datetime import date
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from models import db
+
+# monthly partitions of show are named show_pYYYY_MM (see the migration)
+PARTITION_NAME = re.compile(r'^show_p(\d{4})_(\d{2})$')
+DEFAULT_PARTITION = 'show_default'
+
+
+# ----------------------------------------------------------------------------#
+# Partitions.
+# ----------------------------------------------------------------------------#
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month):
+    return f'show_p{month.year:04d}_{month.month:02d}'
+
+
+def list_partitions(connection):
+    """Monthly partitions currently attached to show, as {month: name}."""
+    rows = connection.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'show'::regclass
+    """)).scalars()
+    partitions = {}
+    for name in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def create_partition(connection, month):
+    """Create the partition for ``month``, moving any of its rows out of the default."""
+    name = _partition_name(month)
+    lower, upper = month, _add_months(month, 1)
+    bounds = {'lower': lower, 'upper': upper}
+    stray = connection.execute(text(
+        f'SELECT count(*) FROM {DEFAULT_PARTITION} WHERE start_time >= :lower AND start_time < :upper'
+    ), bounds).scalar()
+    if not stray:
+        connection.execute(text(
+            f"CREATE TABLE {name} PARTITION OF show FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+        return name
+    # Postgres refuses a new partition while the default holds rows in its
+    # range. The rows are moved between detached tables and the new one is
+    # attached filled, so none of show's row triggers (notifications,
+    # similarity queue, change log) take them for new shows.
+    connection.execute(text(f'ALTER TABLE show DETACH PARTITION {DEFAULT_PARTITION}'))
+    connection.execute(text(f'CREATE TABLE {name} (LIKE show INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    connection.execute(text(
+        f'INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} '
+        f'WHERE start_time >= :lower AND start_time < :upper'), bounds)
+    connection.execute(text(
+        f'DELETE FROM {DEFAULT_PARTITION} WHERE start_time >= :lower AND start_time < :upper'), bounds)
+    connection.execute(text(
+        f"ALTER TABLE show ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    connection.execute(text(f'ALTER TABLE show ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT'))
+    return name
+
+
+def ensure_partitions(months_ahead, today=None):
+    """Make sure every month from the current one to ``months_ahead`` has a partition."""
+    current = (today or date.today()).replace(day=1)
+    created = []
+    with db.engine.begin() as connection:
+        existing = list_partitions(connection)
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            if month not in existing:
+                created.append(create_partition(connection, month))
+    return created
+
+
+def archive_partitions(keep_months, directory, today=None):
+    """Detach partitions older than ``keep_months``, dump them to gzipped CSV and drop them.
+
+    Each partition is handled in its own transaction, so a failure leaves the
+    already archived months archived and the rest attached.
+    """
+    cutoff = _add_months((today or date.today()).replace(day=1), -keep_months)
+    os.makedirs(directory, exist_ok=True)
+    with db.engine.connect() as connection:
+        partitions = list_partitions(connection)
+    archived = []
+    for month, name in sorted(partitions.items()):
+        if month >= cutoff:
+            break
+        path = os.path.join(directory, f'{name}.csv.gz')
+        raw = db.engine.raw_connection()
+        try:
+            with raw.cursor() as cursor:
+                cursor.execute(f'ALTER TABLE show DETACH PARTITION {name}')
+                with gzip.open(path, 'wb') as f:
+                    cursor.copy_expert(f'COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)', f)
+                cursor.execute(f'DROP TABLE {name}')
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            if os.path.exists(path):
+                os.unlink(path)
+            raise
+        finally:
+            raw.close()
+        archived.append(path)
+    return archived
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+shows_cli = AppGroup('shows', help='Maintain the partitioned show table.')
+
+
+@shows_cli.command('partitions')
+@click.option('--months-ahead', type=int, default=None,
+              help='Months of future partitions to keep ready (SHOW_PARTITION_MONTHS_AHEAD).')
+def partitions_command(months_ahead):
+    """Create missing monthly partitions; run daily from cron."""
+    if months_ahead is None:
+        months_ahead = current_app.config.get('SHOW_PARTITION_MONTHS_AHEAD', 12)
+    for name in ensure_partitions(months_ahead):
+        click.echo(f'created {name}')
+
+
+@shows_cli.command('archive')
+@click.option('--keep-months', type=int, default=None,
+              help='Months of history to keep attached (SHOW_ARCHIVE_KEEP_MONTHS).')
+@click.option('--dir', 'directory', default=None,
+              help='Where to write the archives (SHOW_ARCHIVE_DIR).')
+def archive_command(keep_months, directory):
+    """Detach, dump and drop partitions older than the retention window."""
+    if keep_months is None:
+        keep_months = current_app.config.get('SHOW_ARCHIVE_KEEP_MONTHS', 24)
+    directory = directory or current_app.config['SHOW_ARCHIVE_DIR']
+    for path in archive_partitions(keep_months, directory):
+        click.echo(f'archived {path}')
+
+
+def init_app(app):
+    app.cli.add_command(shows_cli)
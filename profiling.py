@@ -0,0 +1,231 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+
+from flask import g, request
+
+import admin
+
+logger = logging.getLogger(__name__)
+
+# where a sample is spent, checked from the innermost frame outwards; SQL
+# issued while rendering (lazy loads) counts as SQL
+CATEGORIES = (
+    ('sql', (f'{os.sep}sqlalchemy{os.sep}', f'{os.sep}psycopg2{os.sep}', f'{os.sep}asyncpg{os.sep}')),
+    ('template', (f'{os.sep}jinja2{os.sep}', f'{os.sep}flask{os.sep}templating.py')),
+    # async views (ASYNC_VIEWS) run on the worker's shared event loop thread,
+    # which this thread only waits for; what the loop spends on SQL and
+    # templates is mixed with the other requests' and cannot be split out
+    ('async', (f'{os.sep}async_views.py',)),
+)
+ASYNC_NOTE = 'async view: time on the shared event loop, not split into sql and template'
+
+
+# ----------------------------------------------------------------------------#
+# Sampler.
+# ----------------------------------------------------------------------------#
+
+class Sampler(object):
+    """Statistical profiler for one thread.
+
+    A background thread snapshots the target thread's stack every
+    ``interval`` seconds; each sample is weighted with the time since the
+    previous one, so the totals add up to the wall time of the request.
+    """
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = []
+        self.started = None
+        self.duration = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        if self.duration is None:
+            self._stop.set()
+            self._thread.join()
+            self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        last = self.started
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            now = time.perf_counter()
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append((stack, now - last))
+            last = now
+
+
+def categorize(stack):
+    for frame in reversed(stack):
+        for category, paths in CATEGORIES:
+            if any(path in frame[1] for path in paths):
+                return category
+    return 'view'
+
+
+def breakdown(samples):
+    """Seconds spent in SQL, template rendering and the view itself, plus
+    waiting on the event loop for an async view."""
+    totals = {'sql': 0.0, 'template': 0.0, 'view': 0.0}
+    for stack, weight in samples:
+        category = categorize(stack)
+        totals[category] = totals.get(category, 0.0) + weight
+    return totals
+
+
+# ----------------------------------------------------------------------------#
+# Output.
+# ----------------------------------------------------------------------------#
+
+def speedscope(name, sampler):
+    """The samples in speedscope's format, with the category as the root frame."""
+    frames, index = [], {}
+
+    def frame_index(frame):
+        if frame not in index:
+            index[frame] = len(frames)
+            function, filename, line = frame
+            frames.append({'name': function, 'file': filename, 'line': line})
+        return index[frame]
+
+    samples, weights = [], []
+    for stack, weight in sampler.samples:
+        root = (f'[{categorize(stack)}]', '', 0)
+        samples.append([frame_index(root)] + [frame_index(frame) for frame in stack])
+        weights.append(weight)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'fyyur',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sampler.duration,
+            'samples': samples,
+            'weights': weights,
+        }],
+    }
+
+
+def folded(sampler):
+    """Collapsed stacks (``a;b;c microseconds``) for flamegraph.pl and friends."""
+    counts = {}
+    for stack, weight in sampler.samples:
+        key = ';'.join([f'[{categorize(stack)}]'] + [f'{function} ({os.path.basename(filename)}:{line})'
+                                                     for function, filename, line in stack])
+        counts[key] = counts.get(key, 0) + weight
+    return ''.join(f'{key} {round(weight * 1e6)}\n' for key, weight in counts.items())
+
+
+def write(directory, sampler):
+    os.makedirs(directory, exist_ok=True)
+    name = f'{request.method} {request.path}'
+    if any(categorize(stack) == 'async' for stack, _ in sampler.samples):
+        name = f'{name} ({ASYNC_NOTE})'
+    base = os.path.join(directory, '{}-{}-{}'.format(
+        datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), os.getpid(),
+        (request.endpoint or 'unknown').replace('.', '_')))
+    with open(base + '.speedscope.json', 'w') as f:
+        json.dump(speedscope(name, sampler), f)
+    with open(base + '.folded', 'w') as f:
+        f.write(folded(sampler))
+    return base + '.speedscope.json'
+
+
+# ----------------------------------------------------------------------------#
+# Request hooks.
+# ----------------------------------------------------------------------------#
+
+class RequestProfiler(object):
+    """Profiles a request when it asks for it or is picked by the sample rate.
+
+    A request asks with the PROFILE_HEADER header (``X-Profile: 1``) and must
+    also pass the admin check. The profile is written to PROFILE_DIR, and
+    the response carries its path and a Server-Timing breakdown. When
+    neither trigger can fire no hook is installed at all.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.header = app.config.get('PROFILE_HEADER', 'X-Profile')
+        self.interval = app.config.get('PROFILE_INTERVAL', 0.001)
+        self.directory = app.config['PROFILE_DIR']
+        on_demand = bool(app.config.get('ADMIN_TOKEN')) or app.debug
+        if not self.sample_rate and not on_demand:
+            return
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.discard)
+        app.extensions['request_profiler'] = self
+
+    def wanted(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return bool(request.headers.get(self.header)) and admin.authorized()
+
+    def start(self):
+        if self.wanted():
+            g.profiler = Sampler(threading.get_ident(), self.interval)
+            g.profiler.start()
+
+    def finish(self, response):
+        sampler = g.pop('profiler', None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        try:
+            path = write(self.directory, sampler)
+        except OSError:
+            logger.exception('Could not write profile')
+            return response
+        totals = breakdown(sampler.samples)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+        timings = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in totals.items()]
+        if 'async' in totals:
+            timings[list(totals).index('async')] += f';desc="{ASYNC_NOTE}"'
+        response.headers.add('Server-Timing', ', '.join(timings + [f'total;dur={sampler.duration * 1000:.1f}']))
+        logger.info('Profiled %s %s in %.1f ms (%s)%s -> %s', request.method, request.path,
+                    sampler.duration * 1000,
+                    ', '.join(f'{name} {seconds * 1000:.1f} ms' for name, seconds in totals.items()),
+                    f' [{ASYNC_NOTE}]' if 'async' in totals else '', path)
+        return response
+
+    def discard(self, exc):
+        # the view raised before after_request could stop the sampler
+        sampler = g.pop('profiler', None)
+        if sampler is not None:
+            sampler.stop()
+
+
+def init_app(app):
+    return RequestProfiler(app)
@@ -0,0 +1,244 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import logging
+import math
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Response, request
+from prometheus_client import Counter, Gauge
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+REJECTED = Counter('fyyur_rejected_requests_total',
+                   'Requests turned away by rate limiting or load shedding',
+                   ['reason', 'endpoint'])
+IN_FLIGHT = Gauge('fyyur_requests_in_flight', 'Requests being handled',
+                  multiprocess_mode='livesum')
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+def parse_limit(limit):
+    """'30/minute' or '100/10 minutes' as (tokens per second, burst)."""
+    match = LIMIT.match(limit)
+    if match is None:
+        raise ValueError(f'Invalid rate limit: {limit!r}')
+    count, multiple, period = match.groups()
+    return int(count) / (int(multiple or 1) * PERIODS[period]), int(count)
+
+
+def _take(tokens, updated, rate, burst, now):
+    """Refill a bucket up to ``burst`` and take one token from it.
+
+    Returns the new token count and, when the bucket was empty, the seconds
+    until the next token.
+    """
+    tokens = burst if tokens is None else min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, None
+    return tokens, (1 - tokens) / rate
+
+
+# ----------------------------------------------------------------------------#
+# Bucket stores.
+# ----------------------------------------------------------------------------#
+
+class MemoryStore(object):
+    """Buckets in this process's memory; enough for a single worker."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (None, now))
+            tokens, retry_after = _take(tokens, updated, rate, burst, now)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return retry_after
+
+    def _prune(self, now):
+        # buckets idle for an hour are full again and can be forgotten
+        for key, (_, updated) in list(self._buckets.items()):
+            if now - updated > 3600:
+                del self._buckets[key]
+
+
+class SQLiteStore(object):
+    """Buckets in a SQLite file shared by the workers of one host.
+
+    Each take is one short write transaction; if the file is locked for
+    longer than ``timeout`` the request is let through rather than failed.
+    """
+
+    def __init__(self, path, timeout=0.05):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite connections must not cross threads or a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+                tokens, retry_after = _take(row[0] if row else None, row[1] if row else now,
+                                            rate, burst, now)
+                conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                             (key, tokens, now))
+                if random.random() < 0.001:
+                    conn.execute('DELETE FROM bucket WHERE updated < ?', (now - 3600,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error:
+            logger.warning('Rate limit store unavailable, letting the request through', exc_info=True)
+            return None
+        return retry_after
+
+
+# ----------------------------------------------------------------------------#
+# Limiter.
+# ----------------------------------------------------------------------------#
+
+def _retry_response(status, retry_after, message):
+    response = Response(message + '\n', status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+class Limiter(object):
+    """Per-client token buckets per endpoint, plus load shedding.
+
+    RATELIMITS maps endpoints to limits such as ``'30/minute'``; other
+    non-GET requests share RATELIMIT_WRITES per endpoint. Clients over
+    their limit get 429 with Retry-After.
+
+    Load shedding answers 503 with Retry-After before the view runs when
+    this worker already handles LOAD_SHED_MAX_CONCURRENT requests, or when
+    every connection of the database pool is checked out. A request that
+    still times out waiting for a connection gets the same 503 instead of
+    a 500.
+    """
+
+    def __init__(self):
+        self.store = None
+        self.limits = {}
+        self.write_limit = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        config = app.config
+        if config.get('RATELIMIT_STORAGE', 'memory') == 'sqlite':
+            self.store = SQLiteStore(config['RATELIMIT_STORAGE_PATH'])
+        else:
+            self.store = MemoryStore()
+        self.limits = {endpoint: parse_limit(limit)
+                       for endpoint, limit in config.get('RATELIMITS', {}).items()}
+        writes = config.get('RATELIMIT_WRITES')
+        self.write_limit = parse_limit(writes) if writes else None
+        self.exempt = set(config.get('LOAD_SHED_EXEMPT', ()))
+        self.max_concurrent = config.get('LOAD_SHED_MAX_CONCURRENT')
+        self.retry_after = config.get('LOAD_SHED_RETRY_AFTER', 5)
+        options = config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        self.pool_capacity = options.get('pool_size', 5) + max(options.get('max_overflow', 10), 0)
+        if config.get('RATELIMIT_ENABLED', True):
+            app.before_request(self.check_rate)
+        if config.get('LOAD_SHED_ENABLED', True):
+            app.before_request(self.admit)
+            app.teardown_request(self.release)
+            app.register_error_handler(PoolTimeoutError, self.pool_timeout)
+        app.extensions['limiter'] = self
+
+    # rate limits
+
+    def limit_for(self, endpoint, method):
+        if endpoint in self.limits:
+            return self.limits[endpoint]
+        if method not in ('GET', 'HEAD', 'OPTIONS'):
+            return self.write_limit
+        return None
+
+    def check_rate(self):
+        limit = self.limit_for(request.endpoint, request.method)
+        if limit is None:
+            return None
+        rate, burst = limit
+        retry_after = self.store.take(f'{request.endpoint}:{request.remote_addr}', rate, burst)
+        if retry_after is None:
+            return None
+        REJECTED.labels('rate_limit', request.endpoint).inc()
+        return _retry_response(429, retry_after, 'Too many requests, slow down.')
+
+    # load shedding
+
+    def pool_exhausted(self):
+        # only QueuePool counts its connections
+        checkedout = getattr(db.engine.pool, 'checkedout', None)
+        return checkedout is not None and checkedout() >= self.pool_capacity
+
+    def admit(self):
+        if request.endpoint in self.exempt:
+            return None
+        with self._lock:
+            busy = self.max_concurrent and self._in_flight >= self.max_concurrent
+            if not busy:
+                self._in_flight += 1
+                request.environ['fyyur.admitted'] = True
+        if busy:
+            return self.shed('concurrency')
+        IN_FLIGHT.inc()
+        if self.pool_exhausted():
+            return self.shed('pool')
+        return None
+
+    def release(self, exc):
+        if request.environ.pop('fyyur.admitted', False):
+            with self._lock:
+                self._in_flight -= 1
+            IN_FLIGHT.dec()
+
+    def shed(self, reason):
+        REJECTED.labels(reason, request.endpoint).inc()
+        return _retry_response(503, self.retry_after, 'Server busy, try again shortly.')
+
+    def pool_timeout(self, error):
+        return self.shed('pool_timeout')
+
+
+limiter = Limiter()
+
+
+def init_app(app):
+    limiter.init_app(app)
@@ -0,0 +1,233 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, text
+
+from models import db, Venue, Artist, Show, SimilarVenue, SimilarArtist, SimilarityQueue
+from utils import LazyModule
+
+np = LazyModule('numpy')
+sparse = LazyModule('scipy.sparse')
+
+# kind: (entity, neighbour table, its entity column, own and other side of a booking)
+KINDS = {
+    'venue': (Venue, SimilarVenue, SimilarVenue.venue_id, Show.venue_id, Show.artist_id),
+    'artist': (Artist, SimilarArtist, SimilarArtist.artist_id, Show.artist_id, Show.venue_id),
+}
+
+
+def similar_statement(kind, entity_id):
+    """The precomputed neighbours of one entity, a primary key range scan."""
+    model, table, key = KINDS[kind][:3]
+    return (select(model.id, model.name, model.image_link, table.score)
+            .join(table, table.similar_id == model.id)
+            .where(key == entity_id)
+            .order_by(table.rank))
+
+
+# ----------------------------------------------------------------------------#
+# Features.
+# ----------------------------------------------------------------------------#
+
+def _tfidf_rows(matrix):
+    """Down-weight features most entities share, then scale rows to unit length."""
+    n = matrix.shape[0]
+    document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + n) / (1 + document_frequency)) + 1
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def load_features(connection, kind, genre_weight=0.5, booking_weight=0.5):
+    """Entity ids and their feature rows: genres next to co-bookings.
+
+    Both blocks are unit rows scaled by the square root of their weight, so
+    the dot product of two rows is the weighted sum of the genre cosine and
+    the booking cosine (venues sharing artists, artists sharing venues).
+    """
+    model, _, _, own, other = KINDS[kind]
+    entities = connection.execute(select(model.id, model.genres).order_by(model.id)).all()
+    ids = np.array([entity_id for entity_id, _ in entities], dtype=np.int64)
+    n = len(ids)
+
+    vocabulary, rows, columns = {}, [], []
+    for i, (_, genres) in enumerate(entities):
+        for genre in {g.strip().lower() for g in genres or [] if g and g.strip()}:
+            rows.append(i)
+            columns.append(vocabulary.setdefault(genre, len(vocabulary)))
+    genres = sparse.csr_matrix((np.ones(len(rows)), (rows, columns)),
+                               shape=(n, max(len(vocabulary), 1)))
+
+    bookings = np.array(connection.execute(
+        select(own, other, func.count())
+        .where(own.isnot(None), other.isnot(None))
+        .group_by(own, other)
+    ).all(), dtype=np.int64).reshape(-1, 3)
+    rows = np.searchsorted(ids, bookings[:, 0])
+    known = rows < n
+    known[known] = ids[rows[known]] == bookings[known, 0]
+    others, columns = np.unique(bookings[known, 1], return_inverse=True)
+    booked = sparse.csr_matrix((np.log1p(bookings[known, 2]), (rows[known], columns)),
+                               shape=(n, max(len(others), 1)))
+
+    features = sparse.hstack([
+        np.sqrt(genre_weight) * _tfidf_rows(genres),
+        np.sqrt(booking_weight) * _tfidf_rows(booked),
+    ]).tocsr()
+    return ids, features
+
+
+def top_k(features, rows, k, min_score, batch_size=1000):
+    """Yield (row, neighbour rows, scores) for ``rows``, best first.
+
+    Similarities are computed a batch of rows at a time against the whole
+    catalog, as one sparse product each.
+    """
+    transposed = features.T.tocsc()
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        scores = (features[batch] @ transposed).tocsr()
+        for j, i in enumerate(batch):
+            lo, hi = scores.indptr[j], scores.indptr[j + 1]
+            columns, values = scores.indices[lo:hi], scores.data[lo:hi]
+            keep = (columns != i) & (values >= min_score)
+            columns, values = columns[keep], values[keep]
+            if len(values) > k:
+                best = np.argpartition(-values, k)[:k]
+                columns, values = columns[best], values[best]
+            order = np.lexsort((columns, -values))
+            yield i, columns[order], values[order]
+
+
+# ----------------------------------------------------------------------------#
+# Refresh.
+# ----------------------------------------------------------------------------#
+
+def affected_rows(features, dirty, listing, full, threshold, min_score, batch_size=1000):
+    """Rows whose neighbour lists a change to the ``dirty`` rows can alter.
+
+    Those are the dirty rows themselves, the ``listing`` rows that list one
+    of them, and the rows for which a dirty row now scores above their
+    current k-th neighbour (``threshold`` where ``full``) or above min_score
+    while they have fewer than k. The other lists are those a full
+    recomputation on ``features`` would give; the idf weights drifting with
+    the catalog are only caught up by the next full refresh.
+    """
+    affected = set(dirty) | set(listing)
+    best = np.zeros(features.shape[0])
+    transposed = features.T.tocsc()
+    for start in range(0, len(dirty), batch_size):
+        scores = features[dirty[start:start + batch_size]] @ transposed
+        best = np.maximum(best, scores.max(axis=0).toarray().ravel())
+    entering = np.where(full, best > threshold, best >= min_score)
+    affected.update(np.flatnonzero(entering).tolist())
+    return sorted(affected)
+
+
+def _affected(connection, kind, ids, features, dirty, k, min_score, batch_size=1000):
+    """affected_rows, with the current lists read from the neighbour table."""
+    _, table, key = KINDS[kind][:3]
+    position = {entity_id: i for i, entity_id in enumerate(ids.tolist())}
+    dirty_ids = [int(ids[i]) for i in dirty]
+
+    listing = [position[entity_id] for (entity_id,) in connection.execute(
+        select(key).distinct().where(table.similar_id.in_(dirty_ids))) if entity_id in position]
+
+    full = np.zeros(len(ids), dtype=bool)
+    threshold = np.full(len(ids), min_score)
+    for entity_id, count, lowest in connection.execute(
+            select(key, func.count(), func.min(table.score)).group_by(key)):
+        if entity_id in position and count >= k:
+            full[position[entity_id]] = True
+            threshold[position[entity_id]] = lowest
+    return affected_rows(features, dirty, listing, full, threshold, min_score, batch_size)
+
+
+def refresh(kind, full=False, k=6, min_score=0.05, genre_weight=0.5, booking_weight=0.5,
+            batch_size=1000):
+    """Recompute the neighbour lists of ``kind`` touched by queued changes
+    (all of them with ``full``). Returns the number of lists rewritten."""
+    _, table, key = KINDS[kind][:3]
+
+    # claimed in a transaction of its own, so the triggers queueing new
+    # changes never wait for the computation
+    with db.engine.begin() as connection:
+        queued = connection.execute(
+            delete(SimilarityQueue).where(SimilarityQueue.kind == kind)
+            .returning(SimilarityQueue.entity_id)).scalars().all()
+    try:
+        with db.engine.begin() as connection:
+            # one refresh per kind at a time
+            connection.execute(text('SELECT pg_advisory_xact_lock(hashtext(:name))'),
+                               {'name': table.__tablename__})
+            ids, features = load_features(connection, kind, genre_weight, booking_weight)
+            if not full and not connection.execute(select(func.count()).select_from(table)).scalar():
+                full = True
+            if full:
+                rows = list(range(len(ids)))
+                connection.execute(delete(table))
+            else:
+                position = {entity_id: i for i, entity_id in enumerate(ids.tolist())}
+                # deleted entities are gone from the table already, and the
+                # lists naming them were queued by the delete trigger
+                dirty = sorted(position[entity_id] for entity_id in queued if entity_id in position)
+                if not dirty:
+                    return 0
+                rows = _affected(connection, kind, ids, features, dirty, k, min_score, batch_size)
+                connection.execute(delete(table).where(key.in_([int(ids[i]) for i in rows])))
+            values = []
+            for i, neighbours, scores in top_k(features, rows, k, min_score, batch_size):
+                values.extend({
+                    key.key: int(ids[i]),
+                    'rank': rank,
+                    'similar_id': int(ids[j]),
+                    'score': float(score),
+                } for rank, (j, score) in enumerate(zip(neighbours, scores), 1))
+            if values:
+                connection.execute(insert(table.__table__), values)
+    except Exception:
+        # hand the claimed changes back for the next run
+        if queued:
+            with db.engine.begin() as connection:
+                connection.execute(text(
+                    'INSERT INTO similarity_queue (kind, entity_id) '
+                    'SELECT :kind, unnest(CAST(:ids AS integer[])) ON CONFLICT DO NOTHING'),
+                    {'kind': kind, 'ids': queued})
+        raise
+    return len(rows)
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+recommendations_cli = AppGroup('recommendations', help='Maintain the similar venues and artists.')
+
+
+@recommendations_cli.command('refresh')
+@click.option('--kind', type=click.Choice(sorted(KINDS)), default=None,
+              help='Only refresh venues or artists.')
+@click.option('--full', is_flag=True, help='Recompute every list, not only the changed ones.')
+def refresh_command(kind, full):
+    """Recompute similar venues and artists; run from cron."""
+    config = current_app.config
+    for name in [kind] if kind else sorted(KINDS):
+        count = refresh(
+            name, full=full,
+            k=config.get('SIMILARITY_TOP_K', 6),
+            min_score=config.get('SIMILARITY_MIN_SCORE', 0.05),
+            genre_weight=config.get('SIMILARITY_GENRE_WEIGHT', 0.5),
+            booking_weight=config.get('SIMILARITY_BOOKING_WEIGHT', 0.5),
+            batch_size=config.get('SIMILARITY_BATCH_SIZE', 1000),
+        )
+        click.echo(f'{name}: {count} lists refreshed')
+
+
+def init_app(app):
+    app.cli.add_command(recommendations_cli)
@@ -0,0 +1,141 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+from xml.sax.saxutils import escape
+
+from flask import Response, abort, current_app, request, stream_with_context, url_for
+from sqlalchemy import func, select
+
+import changes
+from models import db, Venue, Artist, EntityChange
+
+# kind: (entity, detail endpoint, its id argument)
+KINDS = {
+    'venue': (Venue, 'main.show_venue', 'venue_id'),
+    'artist': (Artist, 'main.show_artist', 'artist_id'),
+}
+
+# the protocol's limit per sitemap file
+MAX_URLS = 50000
+
+# URLs joined into each chunk of the response
+WRITE_BATCH = 1000
+
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+NAMESPACE = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def chunks(connection, kind, size):
+    """Yield (first id, last id, lastmod) of consecutive runs of ``size`` entities.
+
+    Each run is found from the end of the previous one on the primary key,
+    so no scan starts over from the beginning of the table. lastmod is the
+    latest change logged for an id of the run.
+    """
+    model = KINDS[kind][0]
+    after = 0
+    while True:
+        chunk = select(model.id).where(model.id > after).order_by(model.id).limit(size).subquery()
+        first, last = connection.execute(select(func.min(chunk.c.id), func.max(chunk.c.id))).one()
+        if first is None:
+            return
+        modified = connection.execute(
+            select(func.max(EntityChange.changed_at))
+            .where(EntityChange.kind == kind, EntityChange.entity_id.between(first, last))).scalar()
+        yield first, last, modified
+        after = last
+
+
+def entries(connection, kind, first, last):
+    """(id, lastmod) of the entities from ``first`` to ``last``, read in batches."""
+    model = KINDS[kind][0]
+    result = connection.execution_options(stream_results=True, max_row_buffer=1000).execute(
+        select(model.id, changes.last_changed(kind, model.id))
+        .where(model.id >= first, model.id <= last).order_by(model.id).limit(MAX_URLS))
+    yield from result
+
+
+def _base_url():
+    base = current_app.config.get('SITEMAP_BASE_URL') or request.url_root
+    return base.rstrip('/')
+
+
+def _w3c(moment):
+    return moment.isoformat(timespec='seconds') if moment is not None else None
+
+
+def _url(tag, loc, modified):
+    lastmod_tag = f'<lastmod>{_w3c(modified)}</lastmod>' if modified is not None else ''
+    return f'<{tag}><loc>{loc}</loc>{lastmod_tag}</{tag}>\n'
+
+
+def _batched(lines, size=WRITE_BATCH):
+    # one write per WRITE_BATCH URLs rather than one per URL
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _stream(generate):
+    # rows are read and written out as the client receives them, on a
+    # connection of the generator's own
+    response = Response(stream_with_context(_batched(generate())), mimetype='application/xml')
+    max_age = current_app.config.get('SITEMAP_MAX_AGE', 3600)
+    response.headers['Cache-Control'] = f'public, max-age={max_age}'
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+def sitemap_index():
+    engine = db.engine
+    base = escape(_base_url())
+    size = min(current_app.config.get('SITEMAP_CHUNK_SIZE', MAX_URLS), MAX_URLS)
+
+    def generate():
+        yield XML_HEADER + f'<sitemapindex xmlns="{NAMESPACE}">\n'
+        with engine.connect() as connection:
+            for kind in KINDS:
+                for first, last, modified in chunks(connection, kind, size):
+                    path = url_for('sitemap_chunk', kind=kind, first=first, last=last)
+                    yield _url('sitemap', base + escape(path), modified)
+        yield '</sitemapindex>\n'
+
+    return _stream(generate)
+
+
+def sitemap_chunk(kind, first, last):
+    if kind not in KINDS or first > last:
+        abort(404)
+    engine = db.engine
+    _, endpoint, argument = KINDS[kind]
+    # '/venues/0' less its 0, so each row only adds its id
+    prefix = escape(_base_url() + url_for(endpoint, **{argument: 0})[:-1])
+
+    def generate():
+        yield XML_HEADER + f'<urlset xmlns="{NAMESPACE}">\n'
+        with engine.connect() as connection:
+            for entity_id, modified in entries(connection, kind, first, last):
+                yield _url('url', f'{prefix}{entity_id}', modified)
+        yield '</urlset>\n'
+
+    return _stream(generate)
+
+
+def robots():
+    lines = ['User-agent: *', 'Disallow:', f'Sitemap: {_base_url()}{url_for("sitemap_index")}']
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain')
+
+
+def init_app(app):
+    app.add_url_rule('/sitemap.xml', 'sitemap_index', sitemap_index)
+    app.add_url_rule('/sitemaps/<kind>-<int:first>-<int:last>.xml', 'sitemap_chunk', sitemap_chunk)
+    app.add_url_rule('/robots.txt', 'robots', robots)
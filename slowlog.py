@@ -0,0 +1,241 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import time
+from datetime import datetime
+from logging.handlers import WatchedFileHandler
+
+from flask import current_app, has_request_context, jsonify, render_template, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import admin
+
+logger = logging.getLogger('fyyur.slow_queries')
+
+# expanded IN lists get one parameter per value; fold them so that the same
+# statement has one fingerprint whatever the list length
+IN_LIST = re.compile(r'\(\s*(?:%\(\w+\)s|%s|\$\d+|\?)(?:\s*,\s*(?:%\(\w+\)s|%s|\$\d+|\?))*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+# a name followed by an opening parenthesis, schema-qualified or quoted
+FUNCTION_CALL = re.compile(r'([A-Za-z_][\w$]*)"?\s*\(')
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:12]
+
+
+def normalize(statement):
+    return IN_LIST.sub('(...)', WHITESPACE.sub(' ', statement).strip())
+
+
+def called_functions(statement):
+    """Lower-cased names of what looks like a function call in ``statement``.
+
+    Keywords followed by a parenthesis (IN, VALUES) come out too; they are
+    never in pg_proc, so they do no harm.
+    """
+    return {name.lower() for name in FUNCTION_CALL.findall(statement)}
+
+
+def params_fingerprint(parameters):
+    # a hash rather than the values, which may hold personal data; equal
+    # fingerprints still show the same call being repeated
+    return _digest(json.dumps(parameters, sort_keys=True, default=str))
+
+
+# ----------------------------------------------------------------------------#
+# Recorder.
+# ----------------------------------------------------------------------------#
+
+class SlowQueryRecorder(object):
+    """Logs every statement slower than ``threshold_ms`` as a JSON line.
+
+    Hooks into the cursor events of every engine, the asyncpg one included.
+    A sample of slow SELECTs (``explain_rate``) is run again under
+    ``EXPLAIN (ANALYZE, BUFFERS)`` inside a savepoint, and the plan is added
+    to the record. SELECTs calling a volatile function (``pg_notify``,
+    ``pg_try_advisory_lock``, ``nextval``...) are never run again, since
+    their effects would happen twice.
+
+    Every worker appends to the same file; records are written a line at a
+    time, and rotation is left to logrotate, the handler reopening the file
+    once it has been moved away.
+    """
+
+    def __init__(self):
+        self.threshold_ms = None
+        self.explain_rate = 0.0
+        # names of the database's volatile functions, read on the first EXPLAIN
+        self.volatile = None
+
+    def init_app(self, app):
+        self.threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS')
+        self.explain_rate = app.config.get('SLOW_QUERY_EXPLAIN_RATE', 0.0)
+        path = app.config.get('SLOW_QUERY_LOG')
+        if path and not any(getattr(h, 'baseFilename', None) == os.path.abspath(path)
+                            for h in logger.handlers):
+            handler = WatchedFileHandler(path, delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+    def record(self, conn, cursor, statement, parameters, executemany, duration_ms):
+        entry = {
+            'time': datetime.utcnow().isoformat(timespec='milliseconds'),
+            'pid': os.getpid(),
+            'route': None,
+            'endpoint': None,
+            'duration_ms': round(duration_ms, 3),
+            'rows': cursor.rowcount,
+            'fingerprint': None,
+            'params': params_fingerprint(parameters),
+            'statement': normalize(statement),
+        }
+        entry['fingerprint'] = _digest(entry['statement'])
+        if has_request_context():
+            rule = request.url_rule.rule if request.url_rule else request.path
+            entry['route'] = f'{request.method} {rule}'
+            entry['endpoint'] = request.endpoint
+        if (not executemany and self.explain_rate and random.random() < self.explain_rate
+                and statement.lstrip()[:6].upper() == 'SELECT'):
+            plan = self.explain(conn, statement, parameters)
+            if plan is not None:
+                entry['plan'] = plan
+        logger.info(json.dumps(entry, default=str))
+
+    def explain(self, conn, statement, parameters):
+        # ANALYZE runs the statement again, hence SELECTs without side effects
+        # only; the savepoint keeps a failing EXPLAIN from aborting the
+        # caller's transaction. None when the statement may not be run again.
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute('SAVEPOINT slow_query_explain')
+            try:
+                if self.volatile is None:
+                    cursor.execute("SELECT DISTINCT lower(proname) FROM pg_proc WHERE provolatile = 'v'")
+                    self.volatile = frozenset(row[0] for row in cursor.fetchall())
+                if called_functions(statement) & self.volatile:
+                    cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+                    return None
+                cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement, parameters)
+                plan = cursor.fetchone()[0]
+            except Exception as e:
+                cursor.execute('ROLLBACK TO SAVEPOINT slow_query_explain')
+                plan = f'EXPLAIN failed: {e}'
+            cursor.execute('RELEASE SAVEPOINT slow_query_explain')
+            return json.loads(plan) if isinstance(plan, str) and plan.startswith('[') else plan
+        except Exception as e:
+            return f'EXPLAIN failed: {e}'
+        finally:
+            cursor.close()
+
+
+recorder = SlowQueryRecorder()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start(conn, cursor, statement, parameters, context, executemany):
+    if recorder.threshold_ms is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _finish(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    if recorder.threshold_ms is not None and duration_ms >= recorder.threshold_ms:
+        try:
+            recorder.record(conn, cursor, statement, parameters, executemany, duration_ms)
+        except Exception:
+            logging.getLogger(__name__).exception('Could not record slow query')
+
+
+@event.listens_for(Engine, 'handle_error')
+def _failed(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start'):
+        conn.info['query_start'].pop()
+
+
+# ----------------------------------------------------------------------------#
+# Report.
+# ----------------------------------------------------------------------------#
+
+def read_log(path, backups):
+    """Records from the log and its rotated files, oldest first."""
+    paths = [f'{path}.{n}' for n in range(backups, 0, -1)] + [path]
+    for name in paths:
+        try:
+            with open(name) as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # a partial line from a rotation in progress
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def aggregate(records, limit=50):
+    """Statements grouped by fingerprint, worst total time first."""
+    statements = {}
+    for entry in records:
+        stats = statements.get(entry['fingerprint'])
+        if stats is None:
+            stats = statements[entry['fingerprint']] = {
+                'fingerprint': entry['fingerprint'],
+                'statement': entry['statement'],
+                'calls': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'routes': {},
+                'last_seen': None,
+                'plan': None,
+            }
+        stats['calls'] += 1
+        stats['total_ms'] += entry['duration_ms']
+        stats['max_ms'] = max(stats['max_ms'], entry['duration_ms'])
+        route = entry.get('route') or '(no request)'
+        stats['routes'][route] = stats['routes'].get(route, 0) + 1
+        stats['last_seen'] = entry['time']
+        if entry.get('plan') is not None:
+            stats['plan'] = entry['plan']
+    worst = sorted(statements.values(), key=lambda s: s['total_ms'], reverse=True)[:limit]
+    for stats in worst:
+        stats['mean_ms'] = stats['total_ms'] / stats['calls']
+        stats['routes'] = sorted(stats['routes'].items(), key=lambda r: r[1], reverse=True)
+    return worst
+
+
+# ----------------------------------------------------------------------------#
+# Controllers.
+# ----------------------------------------------------------------------------#
+
+@admin.admin_required
+def slow_queries():
+    config = current_app.config
+    records = []
+    if config.get('SLOW_QUERY_LOG'):
+        records = read_log(config['SLOW_QUERY_LOG'], config.get('SLOW_QUERY_LOG_BACKUPS', 5))
+    statements = aggregate(records, limit=request.args.get('limit', 50, type=int))
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(statements)
+    return render_template('pages/slow_queries.html', statements=statements,
+                           threshold_ms=recorder.threshold_ms)
+
+
+def init_app(app):
+    recorder.init_app(app)
+    app.add_url_rule('/admin/slow-queries', 'slow_queries', slow_queries)
@@ -0,0 +1,250 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import contextlib
+import json
+import logging
+import os
+import re
+import time
+
+import click
+from flask import Response, current_app, request, url_for
+from flask.cli import AppGroup
+from prometheus_client import Counter
+from sqlalchemy import select
+
+import changes
+from models import db
+from sitemap import KINDS
+from utils import write_atomic
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = {endpoint: (kind, argument) for kind, (_, endpoint, argument) in KINDS.items()}
+
+SERVED = Counter('fyyur_crawler_requests_total',
+                 'Detail page requests from crawlers', ['result'])
+
+
+# ----------------------------------------------------------------------------#
+# Snapshot files.
+# ----------------------------------------------------------------------------#
+
+class SnapshotStore(object):
+    """Rendered detail pages on disk, one file per entity.
+
+    Registered on the invalidation bus, so a venue or artist edited or
+    deleted anywhere loses its snapshot at once; crawlers get the live page
+    for it until the next ``flask crawler snapshot`` writes it again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, kind, entity_id):
+        return os.path.join(self.directory, kind, f'{int(entity_id)}.html')
+
+    def read(self, kind, entity_id):
+        """The snapshot and its modification time, or None."""
+        try:
+            with open(self.path(kind, entity_id), 'rb') as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def write(self, kind, entity_id, data):
+        # written aside and renamed, so readers never see half a page
+        write_atomic(self.path(kind, entity_id), data)
+
+    def remove(self, kind, entity_id):
+        try:
+            os.unlink(self.path(kind, entity_id))
+        except FileNotFoundError:
+            pass
+
+    def _mtimes(self, kind):
+        directory = os.path.join(self.directory, kind)
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return {}
+        mtimes = {}
+        for entry in entries:
+            name = entry.name
+            if name.endswith('.html') and name[:-5].isdigit():
+                with contextlib.suppress(FileNotFoundError):
+                    mtimes[int(name[:-5])] = entry.stat().st_mtime
+        return mtimes
+
+    def ids(self, kind):
+        return set(self._mtimes(kind))
+
+    def older_than(self, kind, seconds):
+        """Ids of the snapshots written more than ``seconds`` ago."""
+        cutoff = time.time() - seconds
+        return {entity_id for entity_id, mtime in self._mtimes(kind).items() if mtime < cutoff}
+
+    def invalidate(self, kind, entity_id):
+        if kind in KINDS:
+            self.remove(kind, entity_id)
+
+    # the database snapshot of the last run, so the next one only renders
+    # what was committed after it
+
+    def _state_path(self):
+        return os.path.join(self.directory, 'state.json')
+
+    def snapshot(self, kind):
+        try:
+            with open(self._state_path()) as f:
+                return json.load(f).get(kind)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def mark(self, kind, snapshot):
+        try:
+            with open(self._state_path()) as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        state[kind] = snapshot
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._state_path(), 'w') as f:
+            json.dump(state, f)
+
+
+# ----------------------------------------------------------------------------#
+# Crawler mode.
+# ----------------------------------------------------------------------------#
+
+class CrawlerMode(object):
+    """Serves crawlers the detail pages from snapshots instead of the database.
+
+    Requests whose User-Agent matches CRAWLER_USER_AGENTS are answered from
+    the snapshot before rate limiting, load shedding or the view run, with
+    Last-Modified from the file so conditional requests get a 304. Without a
+    snapshot the request is handled like any other.
+    """
+
+    def __init__(self):
+        self.store = None
+        self.agents = None
+
+    def init_app(self, app):
+        self.store = SnapshotStore(app.config['SNAPSHOT_DIR'])
+        self.agents = re.compile(app.config.get('CRAWLER_USER_AGENTS', r'bot|crawl|spider'), re.IGNORECASE)
+        app.extensions.setdefault('invalidation_stores', []).append(self.store)
+        if app.config.get('CRAWLER_MODE', True):
+            app.before_request(self.serve)
+        app.extensions['crawler_mode'] = self
+
+    def is_crawler(self):
+        return bool(self.agents.search(request.headers.get('User-Agent', '')))
+
+    def serve(self):
+        target = ENDPOINTS.get(request.endpoint)
+        if target is None or request.method not in ('GET', 'HEAD') or not self.is_crawler():
+            return None
+        kind, argument = target
+        snapshot = self.store.read(kind, request.view_args[argument])
+        if snapshot is None:
+            SERVED.labels('miss').inc()
+            return None
+        SERVED.labels('hit').inc()
+        data, mtime = snapshot
+        response = Response(data, mimetype='text/html')
+        response.last_modified = int(mtime)
+        response.headers['X-Snapshot'] = 'hit'
+        return response.make_conditional(request)
+
+
+crawler_mode = CrawlerMode()
+
+
+# ----------------------------------------------------------------------------#
+# Regeneration.
+# ----------------------------------------------------------------------------#
+
+def _all_ids(connection, kind, batch_size=10000):
+    model = KINDS[kind][0]
+    ids, after = set(), 0
+    while True:
+        batch = connection.execute(select(model.id).where(model.id > after)
+                                   .order_by(model.id).limit(batch_size)).scalars().all()
+        if not batch:
+            return ids
+        ids.update(batch)
+        after = batch[-1]
+
+
+def regenerate(app, store, kind, full=False, max_age=None, batch_size=1000):
+    """Render the snapshots of ``kind`` changed since the last run (all of
+    them with ``full``) and drop those of deleted entities.
+
+    Entities without a snapshot and snapshots older than ``max_age`` seconds
+    are rendered too: pages also change as shows pass or similar venues and
+    artists are recomputed, with nothing logged for the entity. Pages are
+    rendered through the app itself, so they match what users get. Returns
+    the number written and removed.
+    """
+    _, endpoint, argument = KINDS[kind]
+    with app.test_request_context():
+        path = url_for(endpoint, **{argument: 0})[:-1]
+    existing = store.ids(kind)
+    with db.engine.connect() as connection:
+        # taken before reading, so changes committed during the run are in the next one
+        started = changes.current_snapshot(connection)
+        previous = None if full else store.snapshot(kind)
+        current = _all_ids(connection, kind)
+        if previous is None:
+            pending = set(current)
+        else:
+            pending = current - existing
+            for ids in changes.changed_ids(connection, kind, previous, batch_size):
+                pending.update(current.intersection(ids))
+            if max_age:
+                pending |= current & store.older_than(kind, max_age)
+    client = app.test_client()
+    written = 0
+    for entity_id in sorted(pending):
+        response = client.get(f'{path}{entity_id}')
+        if response.status_code == 200:
+            store.write(kind, entity_id, response.get_data())
+            written += 1
+        else:
+            store.remove(kind, entity_id)
+            logger.warning('Snapshot of %s %s not written: %s', kind, entity_id, response.status)
+    removed = existing - current
+    for entity_id in removed:
+        store.remove(kind, entity_id)
+    store.mark(kind, started)
+    return written, len(removed)
+
+
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+crawler_cli = AppGroup('crawler', help='Maintain the detail page snapshots served to crawlers.')
+
+
+@crawler_cli.command('snapshot')
+@click.option('--kind', type=click.Choice(sorted(KINDS)), default=None,
+              help='Only snapshot venues or artists.')
+@click.option('--full', is_flag=True,
+              help='Render every page, not only the changed ones; needed after a deploy.')
+def snapshot_command(kind, full):
+    """Render the snapshots of changed or outdated venues and artists; run from cron."""
+    app = current_app._get_current_object()
+    for name in [kind] if kind else sorted(KINDS):
+        written, removed = regenerate(app, crawler_mode.store, name, full=full,
+                                      max_age=app.config.get('SNAPSHOT_MAX_AGE', 86400),
+                                      batch_size=app.config.get('SNAPSHOT_BATCH_SIZE', 1000))
+        click.echo(f'{name}: {written} written, {removed} removed')
+
+
+def init_app(app):
+    crawler_mode.init_app(app)
+    app.cli.add_command(crawler_cli)
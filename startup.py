@@ -0,0 +1,118 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import builtins
+import os
+import sys
+import time
+from importlib.util import resolve_name
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+
+# ----------------------------------------------------------------------------#
+# Import timing.
+# ----------------------------------------------------------------------------#
+
+class ImportTimer(object):
+    """Records how long each module takes to import while active.
+
+    Wraps ``__import__`` and keeps a stack so that every newly imported module
+    gets both its cumulative time and its self time (minus nested imports).
+    Only meant to be used around boot; it is removed on exit.
+    """
+
+    def __init__(self):
+        self.times = {}
+        self._stack = []
+        self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level == 0 and name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self._stack.append(0.0)
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            if level:
+                package = (globals or {}).get('__package__')
+                name = resolve_name('.' * level + name, package) if package else None
+            if name is not None and name not in self.times:
+                self.times[name] = (elapsed, elapsed - nested)
+
+    def __enter__(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+        return self
+
+    def __exit__(self, *exc_info):
+        builtins.__import__ = self._original
+
+
+# ----------------------------------------------------------------------------#
+# Template precompilation.
+# ----------------------------------------------------------------------------#
+
+def precompile_templates(app):
+    """Compile every template under templates/ and return per-template times.
+
+    Compiled templates land in the environment cache of the current process
+    (shared copy-on-write with workers forked after a preload) and in the
+    on-disk bytecode cache shared by every worker on the host.
+    """
+    env = app.jinja_env
+    times = {}
+    for name in env.list_templates():
+        start = time.perf_counter()
+        env.get_template(name)
+        times[name] = time.perf_counter() - start
+    return times
+
+
+def _log_report(app, title, times, limit=None):
+    ranked = sorted(times.items(), key=lambda item: item[1], reverse=True)
+    total = sum(times.values())
+    app.logger.info('%s: %d in %.1f ms', title, len(times), total * 1000)
+    for name, elapsed in ranked[:limit]:
+        app.logger.info('  %8.1f ms  %s', elapsed * 1000, name)
+
+
+def load_app(profile=None, precompile=True):
+    """Create the app, precompile its templates and log where boot time went.
+
+    Entry points serving live traffic should use this instead of calling
+    ``create_app`` directly, so that no request pays for template compilation.
+    """
+    with ImportTimer() as timer:
+        from app import create_app
+        app = create_app(profile)
+    _log_report(app, 'Imported modules (self time)',
+                {name: self_time for name, (_, self_time) in timer.times.items()},
+                limit=app.config.get('BOOT_REPORT_LIMIT', 15))
+    if precompile and app.config.get('PRECOMPILE_TEMPLATES', True):
+        _log_report(app, 'Compiled templates', precompile_templates(app))
+    return app
+
+
+# ----------------------------------------------------------------------------#
+# Setup.
+# ----------------------------------------------------------------------------#
+
+def init_app(app):
+    cache_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    @app.cli.command('precompile')
+    def precompile_command():
+        """Compile all templates into the bytecode cache."""
+        times = precompile_templates(app)
+        click.echo(f'Compiled {len(times)} templates in {sum(times.values()) * 1000:.1f} ms')
@@ -0,0 +1,54 @@
+import numpy as np
+
+from analytics import KeyCounts, Table, _genres_of
+
+
+def test_key_counts_merges_batches():
+    counts = KeyCounts()
+    counts.add(np.array([5, 3, 5], dtype=np.int64))
+    counts.add(np.array([3, 9], dtype=np.int64))
+
+    assert counts.keys.tolist() == [3, 5, 9]
+    assert counts.counts.tolist() == [2, 2, 1]
+    assert len(counts) == 3
+
+
+def test_key_counts_distinct():
+    counts = KeyCounts()
+    counts.add(np.array([1, 1, 2], dtype=np.int64), distinct=True)
+    counts.add(np.array([2, 2, 4], dtype=np.int64), distinct=True)
+
+    assert counts.keys.tolist() == [1, 2, 4]
+    assert counts.counts.tolist() == [1, 1, 1]
+
+
+def test_key_counts_empty_batch():
+    counts = KeyCounts()
+    counts.add(np.empty(0, dtype=np.int64))
+
+    assert len(counts) == 0
+    assert counts.counts.dtype == np.int64
+
+
+def _artists(genres):
+    indptr = np.cumsum([0] + [len(g) for g in genres]).astype(np.int64)
+    genre = np.array([g for row in genres for g in row], dtype=np.int64)
+    return Table(np.arange(len(genres), dtype=np.int64), indptr=indptr, genre=genre)
+
+
+def test_genres_of_expands_each_artist():
+    artists = _artists([[0, 2], [], [1], [2, 1, 0]])
+
+    rows, genre = _genres_of(artists, np.array([3, 0, 1, 2, 0]))
+
+    assert rows.tolist() == [0, 0, 0, 1, 1, 3, 4, 4]
+    assert genre.tolist() == [2, 1, 0, 0, 2, 1, 0, 2]
+
+
+def test_genres_of_artists_without_genres():
+    artists = _artists([[], []])
+
+    rows, genre = _genres_of(artists, np.array([0, 1, 1]))
+
+    assert rows.tolist() == []
+    assert genre.tolist() == []
@@ -0,0 +1,27 @@
+from sqlalchemy.dialects import postgresql
+
+from fulltext import tsquery
+
+
+def _query_text(expression):
+    params = expression.compile(dialect=postgresql.dialect()).params
+    (text,) = params.values()
+    return text
+
+
+def test_tsquery_ands_words_and_prefixes_the_last():
+    assert _query_text(tsquery('jazz club')) == 'jazz & club:*'
+
+
+def test_tsquery_single_word_is_a_prefix():
+    assert _query_text(tsquery('mus')) == 'mus:*'
+
+
+def test_tsquery_drops_tsquery_operators():
+    # user input must never reach to_tsquery as syntax
+    assert _query_text(tsquery("rock & roll | !jazz ('blues')")) == 'rock & roll & jazz & blues:*'
+
+
+def test_tsquery_without_words():
+    assert tsquery('') is None
+    assert tsquery(' &|! ') is None
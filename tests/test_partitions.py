@@ -0,0 +1,22 @@
+from datetime import date
+
+from partitions import PARTITION_NAME, _add_months, _partition_name
+
+
+def test_add_months_within_year():
+    assert _add_months(date(2026, 3, 1), 2) == date(2026, 5, 1)
+
+
+def test_add_months_across_years():
+    assert _add_months(date(2026, 11, 1), 3) == date(2027, 2, 1)
+    assert _add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert _add_months(date(2026, 1, 1), -25) == date(2023, 12, 1)
+
+
+def test_add_months_zero():
+    assert _add_months(date(2026, 12, 1), 0) == date(2026, 12, 1)
+
+
+def test_partition_name_round_trips():
+    match = PARTITION_NAME.match(_partition_name(date(2026, 7, 1)))
+    assert match.groups() == ('2026', '07')
@@ -0,0 +1,41 @@
+import pytest
+
+from ratelimit import MemoryStore, _take, parse_limit
+
+
+def test_parse_limit_per_period():
+    assert parse_limit('30/minute') == (0.5, 30)
+    assert parse_limit('2/second') == (2, 2)
+    assert parse_limit(' 24 / days ') == (24 / 86400, 24)
+
+
+def test_parse_limit_with_multiple():
+    assert parse_limit('100/10 minutes') == (100 / 600, 100)
+
+
+@pytest.mark.parametrize('limit', ['', '30', '30/fortnight', 'ten/minute', '-1/minute'])
+def test_parse_limit_rejects(limit):
+    with pytest.raises(ValueError):
+        parse_limit(limit)
+
+
+def test_take_starts_with_a_full_bucket():
+    assert _take(None, 0, rate=1, burst=5, now=0) == (4, None)
+
+
+def test_take_refills_up_to_burst():
+    assert _take(1, 0, rate=1, burst=5, now=2) == (2, None)
+    assert _take(1, 0, rate=1, burst=5, now=100) == (4, None)
+
+
+def test_take_from_empty_bucket_says_when_to_retry():
+    tokens, retry_after = _take(0, 0, rate=0.5, burst=5, now=1)
+    assert tokens == 0.5
+    assert retry_after == pytest.approx(1)
+
+
+def test_memory_store_rejects_past_burst():
+    store = MemoryStore()
+    assert [store.take('client', 1 / 60, 3) for _ in range(3)] == [None, None, None]
+    assert store.take('client', 1 / 60, 3) > 0
+    assert store.take('other', 1 / 60, 3) is None
@@ -0,0 +1,70 @@
+import numpy as np
+from scipy import sparse
+
+from recommendations import affected_rows, top_k
+
+K = 3
+MIN_SCORE = 0.2
+
+
+def _normalized(matrix):
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def _features(rng, n, width=12, density=0.3):
+    return _normalized(sparse.random(n, width, density=density, random_state=rng, format='csr')).tocsr()
+
+
+def _lists(features, rows):
+    return {i: list(zip(neighbours.tolist(), scores.tolist()))
+            for i, neighbours, scores in top_k(features, rows, K, MIN_SCORE, batch_size=7)}
+
+
+def _incremental(before, after, dirty):
+    """The lists computed on ``before``, brought up to date for ``after`` the
+    way refresh does it, from what the neighbour table holds."""
+    n = after.shape[0]
+    lists = _lists(before, list(range(n)))
+    listing = [i for i, neighbours in lists.items() if any(j in dirty for j, _ in neighbours)]
+    full = np.array([len(lists[i]) >= K for i in range(n)])
+    threshold = np.array([min(s for _, s in lists[i]) if full[i] else MIN_SCORE for i in range(n)])
+    rows = affected_rows(after, dirty, listing, full, threshold, MIN_SCORE, batch_size=4)
+    lists.update(_lists(after, rows))
+    return lists, rows
+
+
+def test_incremental_matches_full_refresh():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        before = _features(rng, 40)
+        dirty = sorted(rng.choice(40, size=3, replace=False).tolist())
+        after = before.tolil()
+        after[dirty] = _features(rng, len(dirty))
+        after = after.tocsr()
+
+        lists, rows = _incremental(before, after, dirty)
+
+        assert lists == _lists(after, list(range(40)))
+        assert set(dirty) <= set(rows)
+
+
+def test_unchanged_rows_are_not_recomputed():
+    rng = np.random.default_rng(11)
+    features = _features(rng, 40)
+    dirty = [5]
+
+    lists, rows = _incremental(features, features, dirty)
+
+    assert lists == _lists(features, list(range(40)))
+    assert len(rows) < 40
+
+
+def test_row_without_features_has_no_neighbours():
+    features = _normalized(sparse.csr_matrix(np.array([[1.0, 0.0], [0.0, 0.0], [1.0, 1.0]]))).tocsr()
+
+    lists = _lists(features, [0, 1, 2])
+
+    assert lists[1] == []
+    assert [j for j, _ in lists[0]] == [2]
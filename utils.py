@@ -0,0 +1,40 @@
+# ----------------------------------------------------------------------------#
+# Imports
+# ----------------------------------------------------------------------------#
+
+import importlib
+import os
+import tempfile
+
+
+class LazyModule(object):
+    """A module imported on first use rather than with its importer.
+
+    numpy and scipy are only needed by reports and the recommendations
+    refresh, so ``np = LazyModule('numpy')`` keeps them from slowing down
+    every worker's boot while the code reads as if they were imported.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def write_atomic(path, data):
+    """Write ``data`` (bytes or str) to ``path`` aside and rename it into
+    place, so readers never see a partial file."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,8 @@
+# ----------------------------------------------------------------------------#
+# WSGI entry point: gunicorn -c gunicorn.conf.py
+# ----------------------------------------------------------------------------#
+
+from startup import load_app
+
+# the profile comes from FYYUR_ENV, which should be "production" here
+application = app = load_app()